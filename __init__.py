@@ -1,5 +1,4 @@
-import os, sys, json, gzip, io, tempfile, subprocess, requests, shutil, time, uuid, pathlib
-from concurrent.futures import ThreadPoolExecutor
+import os, sys, json, tempfile, subprocess, requests, time, uuid, pathlib, queue, threading, shutil
 from collections import namedtuple
 
 from cudatext import *
@@ -7,6 +6,26 @@ import cudax_lib as apx
 import cudatext_cmd as cmds
 
 from .dlg import Dialog
+from .client import LanguageServerClient
+from .dispatcher import Dispatcher
+from .completions import CompletionScheduler, Debouncer, Prefetcher
+from .cache import CompletionCache, make_hint
+from .docsync import DocumentSync
+from .lineindex import LineIndex
+from .context import ContextProvider
+from .chatstream import ChatStream, answer_text
+from .render import RenderScheduler
+from .conversations import ConversationManager
+from .chatstore import ChatStore
+from .chatrequest import ChatRequestBuilder, SOURCE_USER
+from .chatexport import AnswerWriter
+from .stats import ChatProbe, Stats
+from .download import download_gz
+from .servers import ServerStore
+from .portwatch import PortWatcher, scan_port_dir
+from .protoutil import dict_to_message
+from .supervisor import Supervisor
+from .sharedserver import SharedServer, AttachedProcess
 from .util import split_text_by_length,language_enum,lex_ids,is_editor_valid
 
 from cudax_lib import get_translation
@@ -20,8 +39,11 @@ IS_WIN = os.name=='nt'
 API_URL = 'https://server.codeium.com'
 HEADERS_JSON       = { 'Content-Type': 'application/json' }
 HEADERS_GRPC_PROTO = { 'Content-Type': 'application/grpc+proto' }
+HEADERS_PROTO      = { 'Content-Type': 'application/proto' }
 HEADERS_VSCODE_SITE= { 'Content-Type': 'application/json', 'Accept': 'api-version=3.0-preview.1' }
 SNIP_ID = PLUGIN_NAME+'__snip'
+EXPORT_TAIL_LINES = 50 # lines of answer shown in the tab, when it is written to file
+CACHE_CONTEXT_LINES = 20 # lines around the caret which must not change for cached completion
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
@@ -44,12 +66,28 @@ option_api_key = ''
 option_append_mode = True
 option_version = '1.48.2'
 option_tab_completion = False
+option_debounce_min = 0
+option_debounce_max = 500
+option_min_interval = 150
+option_max_requests = 2
+option_context_lines = 1000
+option_context_bytes = 500000
+option_completion_transport = 'proto'
+option_prefetch_delay = 0
+option_context_documents = 5
+option_context_documents_bytes = 200000
+option_chat_fps = 20
+option_chat_streams = 2
+option_chat_history_bytes = 100000
+option_stats_log = ''
+option_keep_versions = 2
+option_share_server = True
 
 Item = namedtuple('Item', 'hint text suffix text_inline text_inline_mask text_block start_position end_position cursor_offset')
 
 SESSION_ID = str(uuid.uuid4())
 
-class CancelException(Exception): pass
+class ProtoUnsupportedException(Exception): pass
 
 class Command:
 
@@ -64,39 +102,110 @@ class Command:
         self.col = 0
         self.process = None
         self.caret_view = None
+        self.dispatcher = Dispatcher()
+        self.scheduler = CompletionScheduler(self.dispatcher, self.request_completions, self.request_cancel)
+        self.cache = CompletionCache()
 
         global option_token
         global option_api_key
         global option_append_mode
         global option_version
         global option_tab_completion
+        global option_debounce_min
+        global option_debounce_max
+        global option_min_interval
+        global option_max_requests
+        global option_context_lines
+        global option_context_bytes
+        global option_completion_transport
+        global option_prefetch_delay
+        global option_context_documents
+        global option_context_documents_bytes
+        global option_chat_fps
+        global option_chat_streams
+        global option_chat_history_bytes
+        global option_stats_log
+        global option_keep_versions
+        global option_share_server
         option_token = ini_read(fn_config, 'op', 'token', option_token)
         option_api_key = ini_read(fn_config, 'op', 'api_key', option_api_key)
         option_append_mode = str_to_bool(ini_read(fn_config, 'op', 'append_mode', bool_to_str(option_append_mode)))
         option_tab_completion = str_to_bool(ini_read(fn_config, 'op', 'tab_completion', bool_to_str(option_tab_completion)))
         option_version = ini_read(fn_config, 'op', 'version', option_version)
+        option_debounce_min = int(ini_read(fn_config, 'op', 'debounce_min', str(option_debounce_min)))
+        option_debounce_max = int(ini_read(fn_config, 'op', 'debounce_max', str(option_debounce_max)))
+        option_min_interval = int(ini_read(fn_config, 'op', 'min_interval', str(option_min_interval)))
+        option_max_requests = int(ini_read(fn_config, 'op', 'max_requests', str(option_max_requests)))
+        option_context_lines = int(ini_read(fn_config, 'op', 'context_lines', str(option_context_lines)))
+        option_context_bytes = int(ini_read(fn_config, 'op', 'context_bytes', str(option_context_bytes)))
+        option_completion_transport = ini_read(fn_config, 'op', 'completion_transport', option_completion_transport)
+        option_prefetch_delay = int(ini_read(fn_config, 'op', 'prefetch_delay', str(option_prefetch_delay)))
+        option_context_documents = int(ini_read(fn_config, 'op', 'context_documents', str(option_context_documents)))
+        option_context_documents_bytes = int(ini_read(fn_config, 'op', 'context_documents_bytes', str(option_context_documents_bytes)))
+        option_chat_fps = int(ini_read(fn_config, 'op', 'chat_fps', str(option_chat_fps)))
+        option_chat_streams = int(ini_read(fn_config, 'op', 'chat_streams', str(option_chat_streams)))
+        option_chat_history_bytes = int(ini_read(fn_config, 'op', 'chat_history_bytes', str(option_chat_history_bytes)))
+        option_stats_log = ini_read(fn_config, 'op', 'stats_log', option_stats_log)
+        option_keep_versions = int(ini_read(fn_config, 'op', 'keep_versions', str(option_keep_versions)))
+        option_share_server = str_to_bool(ini_read(fn_config, 'op', 'share_server', bool_to_str(option_share_server)))
         self.token = option_token
         self.api_key = option_api_key
+        self.debouncer = Debouncer(self.scheduler, self.on_debounced,
+            option_debounce_min, option_debounce_max, option_min_interval, option_max_requests)
+        self.docsync = DocumentSync(option_context_lines, option_context_bytes)
+        self.completion_transport = option_completion_transport
+        self.prefetcher = Prefetcher(self.scheduler, self.on_prefetch, option_prefetch_delay, option_max_requests)
+        self.context = ContextProvider(option_context_documents, option_context_documents_bytes)
+        self.renderer = RenderScheduler(self.render_chat, option_chat_fps, poll=self.poll_chat)
+        self.chats = ConversationManager(self.run_chat_stream, option_chat_streams, option_chat_history_bytes)
+        # every worker and every chat stream thread can hold a connection at once
+        self.client = LanguageServerClient(pool_size=self.dispatcher.max_workers + option_chat_streams)
+        self.chat_request_builder = None
+        self.servers = ServerStore(os.path.join(app_path(APP_DIR_DATA), PLUGIN_NAME), BIN_SUFFIX, option_keep_versions)
+        self.executable = None
+        self.server_version = None
+        self.downloading = None # version
+        self.download_stop = threading.Event() # set on exit, the download is continued next time
+        self.supervisor = Supervisor()
+        self.shared = SharedServer(os.path.join(app_path(APP_DIR_DATA), PLUGIN_NAME))
+        self.shared_pid = None # pid of shared server which we are registered with
+        self.requeue = set() # editor handles whose completion was lost by server restart
+        self.chat_tails = {} # editor handle -> first line of answer which is written to file
+        self.chat_probes = {} # editor handle -> ChatProbe of the answer which is rendered
+        self.stats = Stats(log_file=option_stats_log)
+        self.export_target = ''
+        self.chat_store = ChatStore(os.path.join(app_path(APP_DIR_DATA), PLUGIN_NAME, 'chats'), self.dispatcher)
 
-        self.conversations = {}
         self.in_process_of_creating_new_tab = False
-        self.in_process_of_answering = False
         self.in_process_of_asking = False
-        self.cancel = False
-        self.messages = []
+        self.in_process_of_logging_in = False
         self.completions = []
         self.completion_allowed = False
-        self.go_to_end = True
-        self.comp_requests_active = 0
-        self.comp_result_list = {}
         self.shutting_down = False
         self.ask_command_was_triggered = False
+        self.ask_to_file = False # mode of the question which waits for login
 
 
     def config(self):
         ini_write(fn_config, 'op', 'append_mode', bool_to_str(option_append_mode))
         ini_write(fn_config, 'op', 'tab_completion', bool_to_str(option_tab_completion))
         ini_write(fn_config, 'op', 'version', option_version)
+        ini_write(fn_config, 'op', 'debounce_min', str(option_debounce_min))
+        ini_write(fn_config, 'op', 'debounce_max', str(option_debounce_max))
+        ini_write(fn_config, 'op', 'min_interval', str(option_min_interval))
+        ini_write(fn_config, 'op', 'max_requests', str(option_max_requests))
+        ini_write(fn_config, 'op', 'context_lines', str(option_context_lines))
+        ini_write(fn_config, 'op', 'context_bytes', str(option_context_bytes))
+        ini_write(fn_config, 'op', 'completion_transport', option_completion_transport)
+        ini_write(fn_config, 'op', 'prefetch_delay', str(option_prefetch_delay))
+        ini_write(fn_config, 'op', 'context_documents', str(option_context_documents))
+        ini_write(fn_config, 'op', 'context_documents_bytes', str(option_context_documents_bytes))
+        ini_write(fn_config, 'op', 'chat_fps', str(option_chat_fps))
+        ini_write(fn_config, 'op', 'chat_streams', str(option_chat_streams))
+        ini_write(fn_config, 'op', 'chat_history_bytes', str(option_chat_history_bytes))
+        ini_write(fn_config, 'op', 'stats_log', option_stats_log)
+        ini_write(fn_config, 'op', 'keep_versions', str(option_keep_versions))
+        ini_write(fn_config, 'op', 'share_server', bool_to_str(option_share_server))
         file_open(fn_config)
 
     def get_token(self):
@@ -137,34 +246,46 @@ class Command:
         pass;    LOG and print("got api_key:", api_key)
         return api_key
 
-    def download_server(self, out_file):
+    def download_server(self, out_file, callback):
+        '''
+        Download in background, callback(ok) is called on the UI thread.
+        '''
         url = "https://github.com/Exafunction/codeium/releases/download/language-server-v{}/language_server_{}.gz".format(
             option_version,
             BIN_SUFFIX
         )
 
-        msg_status(_('{}: Downloading server...').format(self.name), process_messages=True)
-        response = requests.get(url)
+        progress = [0, 0] # updated by the worker
+        def report(done, total):
+            progress[:] = done, total
 
-        if response.status_code == 200:
-            buffer = io.BytesIO(response.content)
+        def show_progress(*args, **kwargs):
+            done, total = progress
+            if total:
+                msg_status(_('{}: Downloading server... {}%').format(self.name, done * 100 // total))
+            else:
+                msg_status(_('{}: Downloading server... {} MB').format(self.name, done // (1024*1024)))
+
+        def on_done(result):
+            timer_proc(TIMER_STOP, show_progress, 0)
+            if result is None:
+                # error is already printed by dispatcher
+                print("ERROR: Cannot download Codeium lang server, run \"Log in\" to continue the download")
+                msg_status(_('{}: Cannot download server').format(self.name))
+            else:
+                pass;    LOG and print(_("Codeium lang server downloaded!"))
+            callback(result is not None)
 
-            with gzip.GzipFile(fileobj=buffer, mode="rb") as gz_file:
-                with open(out_file, "wb") as f_out:
-                    shutil.copyfileobj(gz_file, f_out)
+        msg_status(_('{}: Downloading server...').format(self.name))
+        timer_proc(TIMER_START, show_progress, 250)
+        def download():
+            return download_gz(url, out_file, report, stop=self.download_stop.is_set)
 
-            pass;    LOG and print(_("Codeium lang server downloaded!"))
-        else:
-            print("ERROR: Cannot download Codeium lang server: {} - {}".format(response.status_code, response.reason))
-            return
+        self.download_stop.clear()
+        self.dispatcher.submit(download, callback=on_done)
 
-    def get_executable(self):
-        data_dir = app_path(APP_DIR_DATA)
-        codeium_dir = os.path.join(data_dir, PLUGIN_NAME)
-        os.makedirs(codeium_dir, exist_ok=True)
-
-        executable = os.path.join(codeium_dir,'language_server_'+BIN_SUFFIX)
-        return executable
+    def get_executable(self, version=None):
+        return self.servers.path(version or option_version)
 
     def get_server_info(self):
         import datetime
@@ -172,7 +293,7 @@ class Command:
         info = ''
         local_timestamp = None
         try:
-            ex = self.get_executable()
+            ex = self.executable or self.get_executable()
             output = subprocess.check_output([ex, '--stamp']).decode()
             import re
             match = re.search(r'BUILD_TIMESTAMP: (\d+)', output)
@@ -185,9 +306,22 @@ class Command:
         except:
             info += "Can't get Codeium server binary info\n\n"
 
+        uptime = self.supervisor.uptime()
+        if uptime is not None:
+            uptime = '{:d}:{:02d}:{:02d}'.format(int(uptime // 3600), int(uptime % 3600 // 60), int(uptime % 60))
+        info += _("Uptime: \t{}\n").format(uptime or '-')
+        info += _("Restarts: \t{}\n").format(self.supervisor.restarts)
+        if self.shared_pid is not None:
+            record = self.shared.read()
+            clients = len(record['clients']) if record and record['pid'] == self.shared_pid else 1
+            info += _("Shared by CudaText instances: \t{}\n").format(clients)
+        if self.supervisor.last_reason:
+            info += _("Last restart reason: \t{}\n").format(self.supervisor.last_reason)
+        info += '\n'
         info += _("Version in config: \t{}\n").format(option_version)
+        info += _("Downloaded versions: \t{}\n").format(', '.join(self.servers.versions()))
         info += _("Newest version can be found by using command 'Get available versions' in Command palette.\n")
-        info += _("\nTo update your server binary, delete old one and change version in config.")
+        info += _("\nTo update your server binary, change version in config. It will be downloaded while the old one works, and used after restart.")
 
         msg_box(info, MB_ICONINFO)
 
@@ -206,6 +340,8 @@ class Command:
         if self.process is not None:
             self.find_port()
             return
+        if self.in_process_of_logging_in:
+            return
 
         msg_status(_('{}: Starting...').format(self.name))
 
@@ -213,32 +349,120 @@ class Command:
             self.get_token()
 
         if not self.api_key:
-            with ThreadPoolExecutor() as ex:
-                future = ex.submit(self.register_user, self.token)
-                while not future.done():
-                    app_idle()
-                    time.sleep(0.001)
-                self.api_key = future.result()
-
-            if not self.api_key:
-                print(_("ERROR: {}: Can't register user. Maybe token has expired. Try getting new token.").format(self.name))
-                return
+            def callback(api_key):
+                self.in_process_of_logging_in = False
+                self.api_key = api_key
+                if not self.api_key:
+                    print(_("ERROR: {}: Can't register user. Maybe token has expired. Try getting new token.").format(self.name))
+                    return
+                self._log_in()
+
+            self.in_process_of_logging_in = True
+            self.dispatcher.submit(self.register_user, self.token, callback=callback)
+            return
+
+        self._log_in()
 
+    def _log_in(self):
         # save api_key to .ini
         global option_api_key
         option_api_key = self.api_key
         ini_write(fn_config, 'op', 'api_key', option_api_key)
 
         self.manager_dir = tempfile.mkdtemp(prefix=self.name+'_')
-        self.executable = self.get_executable()
+        version = option_version
+        self.servers.migrate()
+
+        if not self.servers.installed(version):
+            cached = self.servers.versions()
+            if self.downloading != version:
+                self.downloading = version
+                def on_download(ok):
+                    self.downloading = None
+                    if ok:
+                        self.servers.add(version)
+                        self.servers.cleanup(protect={version, self.server_version})
+                    if cached:
+                        if ok:
+                            msg_status(_('{}: server {} is downloaded, it will be used after restart').format(self.name, version))
+                        return
+                    self.in_process_of_logging_in = False
+                    if ok:
+                        self.executable = self.get_executable(version)
+                        self.server_version = version
+                        self.start_server()
+
+                os.makedirs(os.path.dirname(self.get_executable(version)), exist_ok=True)
+                self.download_server(self.get_executable(version), on_download)
+            if not cached:
+                self.in_process_of_logging_in = True
+                return
+            # old version works while the new one is downloaded
+            version = cached[0]
 
-        if not os.path.exists(self.executable):
-            self.download_server(self.executable)
+        self.executable = self.get_executable(version)
+        self.server_version = version
+        self.servers.use(version)
 
         def sub(*args, **kwargs):
-            self.run_server(self.executable, self.manager_dir)
+            self.start_server()
         timer_proc(TIMER_START_ONE, sub, 50)
 
+    def start_server(self):
+        '''
+        Connect to the server which is already started by another CudaText instance, or run our own.
+        '''
+        if not option_share_server:
+            self.run_server(self.executable, self.manager_dir)
+            return
+
+        def callback(record):
+            if self.process is not None:
+                return
+            if record is None:
+                self.run_server(self.executable, self.manager_dir)
+            else:
+                self.attach_server(record)
+
+        # blocks log_in() while we look for the server
+        self.in_process_of_logging_in = True
+        self.dispatcher.submit(self.find_shared_server, callback=callback)
+
+    def find_shared_server(self):
+        '''
+        Returns record of running shared server if it has the version we would run
+        and answers the heartbeat. Runs in background thread.
+        '''
+        record = self.shared.read()
+        if record is None:
+            return None
+        if record.get('version') != self.server_version:
+            # version was changed in config: new one is used, our server will be private
+            pass;    LOG and print("Shared server has other version:", record.get('version'))
+            return None
+        try:
+            response = self.client.post('Heartbeat', json.dumps(self.heartbeat_data()), HEADERS_JSON, timeout=2, port=record['port'])
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            pass;    LOG and print("Shared server does not respond:", e)
+            return None
+        if not self.shared.join(os.getpid(), record['pid']):
+            return None
+        return record
+
+    def attach_server(self, record):
+        self.in_process_of_logging_in = False
+        if self.manager_dir != record['manager_dir']:
+            shutil.rmtree(self.manager_dir, ignore_errors=True)
+        self.manager_dir = record['manager_dir']
+        self.executable = record.get('executable') or self.executable
+        self.server_version = record.get('version') or self.server_version
+        self.process = AttachedProcess(record['pid'])
+        self.shared_pid = record['pid']
+        self.supervisor.watch(self.process)
+        pass;    LOG and print("Attached to shared server:", record['pid'])
+        self.on_server_ready(record['port'])
+
     def run_server(self, executable, manager_dir):
         if not IS_WIN:
             os.chmod(executable, 0o755)
@@ -251,49 +475,132 @@ class Command:
         if IS_WIN:
             startupinfo = subprocess.STARTUPINFO()
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-        self.process = subprocess.Popen(args, startupinfo=startupinfo)
-
-        def wait_for_port_file():
-            self.port = None
+        watcher = PortWatcher(manager_dir)
+        if option_share_server:
+            # shared server outlives us, so its output can't go to our pipe:
+            # it would get SIGPIPE when we exit. port is taken from port file only
+            # and it must not get SIGHUP/Ctrl+C of the terminal CudaText was started from
+            if IS_WIN:
+                detach = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS}
+            else:
+                detach = {'start_new_session': True}
+            with open(os.path.join(manager_dir, 'server.log'), 'wb') as log:
+                self.process = subprocess.Popen(args, startupinfo=startupinfo,
+                    stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, **detach)
+        else:
+            # output is read to get the port from it, and so the pipe never blocks the server
+            self.process = subprocess.Popen(args, startupinfo=startupinfo,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            threading.Thread(target=watcher.read_output, args=(self.process.stdout,),
+                name='codeium-output', daemon=True).start()
+        self.supervisor.watch(self.process)
+        process = self.process
+
+        def wait_for_port():
             self.shutting_down = False
-            n = 0
-            while self.port is None:
-                self.find_port()
-                if self.port:
-                    break
-                time.sleep(0.3)
-                n += 1
-                # 0.3*25 - waiting ~7.5 seconds for port file
-                if n > 25 or self.shutting_down:
-                    #print("ERROR: {}: {}".format(
-                    #    self.name, "port can't be found. please, try again.")
-                    #)
-                    self.shutdown()
-                    self.shutting_down = False
-                    break
+            # port file usually appears in less than a second
+            # no need to wait if server has crashed on start
+            return watcher.wait(7.5, stop=lambda: self.shutting_down or process.poll() is not None)
+
+        def callback(port):
+            if process is not self.process:
+                return # server was restarted or shut down meanwhile
+            self.in_process_of_logging_in = False
+            if not port and self.supervisor.restarting and not self.shutting_down:
+                self.restart_server(_("port can't be found"))
+                return
+            if not port:
+                #print("ERROR: {}: {}".format(
+                #    self.name, "port can't be found. please, try again.")
+                #)
+                self.shutdown()
+                self.shutting_down = False
+                return
+
+            if option_share_server and self.shared.publish(os.getpid(), process.pid, port,
+                    self.server_version, executable, manager_dir):
+                self.shared_pid = process.pid
+            self.on_server_ready(port)
 
-        with ThreadPoolExecutor() as ex:
-            future = ex.submit(wait_for_port_file)
+        self.port = None
+        self.dispatcher.submit(wait_for_port, callback=callback)
 
-            while not future.done():
-                app_idle()
-                time.sleep(0.001)
+    def on_server_ready(self, port):
+        self.port = port
+        self.client.port = port
+        pass;    LOG and print("Found port:", self.port)
 
-            if self.port:
-                timer_proc(TIMER_STOP,  self.heartbeat, 5000)
-                timer_proc(TIMER_START, self.heartbeat, 5000)
-                msg_status(_("{}: Logged in").format(self.name))
+        timer_proc(TIMER_STOP,  self.heartbeat, 5000)
+        timer_proc(TIMER_START, self.heartbeat, 5000)
+        msg_status(_("{}: Logged in").format(self.name))
 
-                if self.ask_command_was_triggered:
-                    self.ask_command_was_triggered = False
-                    timer_proc(TIMER_START_ONE, lambda _: self._ask(), 50)
+        if self.ask_command_was_triggered:
+            self.ask_command_was_triggered = False
+            to_file = self.ask_to_file
+            timer_proc(TIMER_START_ONE, lambda _: self._ask(to_file), 50)
+
+        # completions which were lost with the old server
+        ed_handle = ed.get_prop(PROP_HANDLE_SELF)
+        if ed_handle in self.requeue:
+            timer_proc(TIMER_START_ONE, lambda _: self.on_debounced(ed_handle), 50)
+        self.requeue.clear()
+
+    def restart_server(self, reason):
+        '''
+        Stop dead or hanging server and start it again after backoff delay.
+        '''
+        delay = self.supervisor.next_delay(reason)
+        # real completion requests which are in flight will be sent again
+        self.requeue.update(h for h, active in self.scheduler.active.items() if not active[3])
+        self.scheduler.cancel_all()
+        self.prefetcher.cancel()
+        self.port = None
+        self.client.port = None
+        timer_proc(TIMER_STOP, self.heartbeat, 5000)
+        # shared server is dead or hangs, other instances will find that it's gone
+        self.shared_pid = None
+        self.kill_server()
+
+        if delay is None:
+            self.supervisor.stop()
+            self.requeue.clear()
+            self.in_process_of_logging_in = False
+            print(_("ERROR: {}: server {}, giving up after several restarts. Use 'Log in' command to start it again.").format(self.name, reason))
+            msg_status(_('{}: Server has stopped').format(self.name))
+            return
+
+        print(_("ERROR: {}: server {}, restarting in {} s").format(self.name, reason, delay))
+        msg_status(_('{}: Restarting server...').format(self.name))
+        # blocks log_in() until the new server is started
+        self.in_process_of_logging_in = True
+        timer_proc(TIMER_START_ONE, self.on_restart_timer, int(delay * 1000))
+
+    def on_restart_timer(self, *args, **kwargs):
+        if self.shutting_down or self.process is not None:
+            return
+        # port file of the old server must not be found
+        old_dir = self.manager_dir
+        self.manager_dir = tempfile.mkdtemp(prefix=self.name+'_')
+        if old_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+        # another instance could have restarted the shared server already
+        self.start_server()
+
+    def kill_server(self):
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
 
     def find_port(self, tag=''):
-        import re
-        files = os.listdir(self.manager_dir)
-        num_files = [f for f in files if re.match(r'^\d+$', f)]
-        if num_files:
-            self.port = int(num_files[0])
+        port = scan_port_dir(self.manager_dir)
+        if port is not None:
+            self.port = port
+            self.client.port = self.port
             pass;    LOG and print("Found port:", self.port)
 
 
@@ -301,35 +608,81 @@ class Command:
         self.hide_hint()
         if self.port is None:
             self.log_in()
-            if self.port is None:
-                return
+            return
+
+        ed_handle = ed.get_prop(PROP_HANDLE_SELF)
+        caret = tuple(ed.get_carets()[0][:2])
+        col, row = caret
+        line_prefix = self.get_line_prefix(ed, caret)
+        context = self.get_cache_context(ed, caret)
 
-        with ThreadPoolExecutor() as ex:
-            self.comp_requests_active += 1
-            future = ex.submit(self.request_completions)
-            while not future.done():
-                app_idle()
-                time.sleep(0.001)
-            self.comp_requests_active -= 1
-            items = future.result()
-            self.comp_result_list[self.comp_requests_active] = items
+        # user typed the beginning of a completion we already have
+        if line_prefix is not None:
+            completions = self.cache.get(ed_handle, row, line_prefix, context)
+            if completions:
+                self.show_completions(completions, use_hint)
+                return
 
-        # we interested only in newest result
-        if self.comp_requests_active != 0:
+        data, first_row = self.build_completions_request()
+        if data is None:
             return
 
-        # newest is with max key (!)
-        max_key = max(self.comp_result_list.keys())
-        items = self.comp_result_list[max_key]
+        def callback(items):
+            if items is None:
+                return
+            completions = self.parse_completions(items, first_row)
+            if line_prefix is not None:
+                self.cache.put(ed_handle, row, line_prefix, completions, context=context)
+
+            # drop result if user went to another tab or moved caret meanwhile
+            if ed.get_prop(PROP_HANDLE_SELF) != ed_handle or tuple(ed.get_carets()[0][:2]) != caret:
+                return
+            self.show_completions(completions, use_hint)
+
+        self.scheduler.request(ed_handle, data, callback)
+
+    def get_line_prefix(self, editor, caret):
+        col, row = caret
+        line_prefix = (editor.get_text_line(row) or '')[:col]
+        if len(line_prefix) < col:
+            return None # caret in virtual space, don't cache
+        return line_prefix
+
+    def get_cache_context(self, editor, caret):
+        '''
+        Fingerprint of the document around the caret, except the text before the caret
+        (it is a part of the cache key): line count, rest of the caret line, nearby lines.
+        '''
+        col, row = caret
+        count = editor.get_line_count()
+        lines = tuple(editor.get_text_line(i)
+            for i in range(max(0, row - CACHE_CONTEXT_LINES), min(count, row + CACHE_CONTEXT_LINES + 1))
+            if i != row)
+        return hash((count, (editor.get_text_line(row) or '')[col:], lines))
+
+    def on_prefetch(self, ed_handle, caret):
+        if self.port is None or self.chats.answering():
+            return
+        if ed.get_prop(PROP_HANDLE_SELF) != ed_handle or tuple(ed.get_carets()[0][:2]) != caret:
+            return
+        col, row = caret
+        line_prefix = self.get_line_prefix(ed, caret)
+        context = self.get_cache_context(ed, caret)
+        if line_prefix is None or self.cache.get(ed_handle, row, line_prefix, context):
+            return
 
-        if items is None:
+        data, first_row = self.build_completions_request()
+        if data is None:
             return
 
-        self.comp_result_list.clear()
+        def callback(items):
+            if items:
+                completions = self.parse_completions(items, first_row)
+                self.cache.put(ed_handle, row, line_prefix, completions, speculative=True, context=context)
 
-        result = 'result' if len(items) == 1 else 'results'
-        msg_status(_("{}: Got {} {}").format(self.name, len(items), result))
+        self.scheduler.request(ed_handle, data, callback, speculative=True)
 
+    def parse_completions(self, items, first_row=0):
         ## debug
         #ed.cmd(cmds.cmd_FileNew)
         #ed.insert(0, 0, str(items))
@@ -359,23 +712,15 @@ class Command:
 
             start_position = comp['range']['startPosition']
             end_position   = comp['range']['endPosition']
-            start_position = (int(start_position.get('col', 0)), int(start_position.get('row', 0)))
-            end_position   = (int(end_position.get('col', 0)), int(end_position.get('row', 0)))
+            start_position = (int(start_position.get('col', 0)), int(start_position.get('row', 0)) + first_row)
+            end_position   = (int(end_position.get('col', 0)), int(end_position.get('row', 0)) + first_row)
 
             suffix = comp.get('suffix', None)
             cursor_offset = int(suffix.get('deltaCursorOffset', 0)) if suffix else 0
             suffix = suffix['text'] if suffix else ''
 
-            def rep_chars(text):
-                return text.replace('\n',' ').replace('\t',' ')
-
-            if text_inline:
-                hint = rep_chars(text_inline) + ' ' + rep_chars(text_block)
-            else:
-                hint = rep_chars(text)
-
             completions.append(Item(
-                hint.strip(),
+                make_hint(text, text_inline, text_block),
                 text,
                 suffix,
                 text_inline,
@@ -385,6 +730,11 @@ class Command:
                 end_position,
                 cursor_offset,
             ))
+        return completions
+
+    def show_completions(self, completions, use_hint):
+        result = 'result' if len(completions) == 1 else 'results'
+        msg_status(_("{}: Got {} {}").format(self.name, len(completions), result))
 
         self.completions = completions
 
@@ -435,41 +785,64 @@ class Command:
         item_ind = int(item_ind)
 
         item = self.completions[item_ind]
+        self.insert_completion(ed_self, item)
 
+    def insert_completion(self, ed_self: Editor, item):
+        text = item.text + item.suffix
         new_caret = ed_self.replace(
             item.start_position[0],
             item.start_position[1],
             item.end_position[0],
             item.end_position[1],
-            item.text + item.suffix
+            text
         )
 
         if item.cursor_offset:
-            offset = ed_self.convert(CONVERT_CARET_TO_OFFSET, new_caret[0], new_caret[1])
-            offset += item.cursor_offset
-            new_caret = ed_self.convert(CONVERT_OFFSET_TO_CARET, offset, 0)
-            new_caret = (new_caret[0], new_caret[1], -1, -1)
+            # caret is at the end of inserted text, find new position inside of it
+            offset = len(text) + item.cursor_offset
+            if 0 <= offset <= len(text):
+                col, row = LineIndex.from_text(text).position(offset)
+                if row == 0:
+                    col += item.start_position[0]
+                new_caret = (col, item.start_position[1] + row, -1, -1)
+            else:
+                offset = ed_self.convert(CONVERT_CARET_TO_OFFSET, new_caret[0], new_caret[1])
+                offset += item.cursor_offset
+                new_caret = ed_self.convert(CONVERT_OFFSET_TO_CARET, offset, 0)
+                new_caret = (new_caret[0], new_caret[1], -1, -1)
 
         ed_self.set_caret(*new_caret)
 
 
+    def heartbeat_data(self):
+        return {
+            'metadata': {
+                'api_key': self.api_key,
+                'ide_name': 'vscode',
+                'ide_version': '1.77.3',
+                'extension_version': option_version,
+                }
+        }
+
     def heartbeat(self, *args):
+        code = self.supervisor.exit_code()
+        if code is not None:
+            self.restart_server(_('exited with code {}').format(code))
+            return
+
+        def callback(result):
+            if self.port is None:
+                return # restarted or shut down meanwhile
+            if result is not None:
+                self.supervisor.heartbeat_ok()
+            elif self.supervisor.heartbeat_failed():
+                self.restart_server(_('does not respond'))
+
         def _heartbeat_request():
-            url = 'http://127.0.0.1:{}/exa.language_server_pb.LanguageServerService/Heartbeat'.format(
-                self.port
-            )
-
-            data = {
-                'metadata': {
-                    'api_key': self.api_key,
-                    'ide_name': 'vscode',
-                    'ide_version': '1.77.3',
-                    'extension_version': option_version,
-                    }
-            }
+            data = self.heartbeat_data()
 
             try:
-                response = requests.post(url, headers=HEADERS_JSON, data=json.dumps(data), timeout=4)
+                response = self.client.post('Heartbeat', json.dumps(data), HEADERS_JSON, timeout=4)
                 response.raise_for_status()
             except requests.exceptions.Timeout:
                 print("ERROR: Heartbeat failed: The request timed out.")
@@ -483,38 +856,37 @@ class Command:
             result_str = result.decode('utf-8')
             return result_str
 
-        with ThreadPoolExecutor() as ex:
-            future = ex.submit(_heartbeat_request)
-            while not future.done():
-                app_idle()
-                time.sleep(0.001)
+        self.dispatcher.submit(_heartbeat_request, callback=callback)
 
     def on_click(self, ed_self, state):
-        if (self.in_process_of_answering
-         and ed_self.get_prop(PROP_TAG, 'codeium:') == 'chat'):
+        conversation = self.chats.by_editor(ed_self.get_prop(PROP_HANDLE_SELF))
+        if conversation is not None and conversation.answering:
 
-            if self.go_to_end:
+            if conversation.go_to_end:
                 ed_self.set_prop(PROP_SCROLL_VERT_SMOOTH, ed_self.get_prop(PROP_SCROLL_VERT_SMOOTH)-1)
                 ed_self.cmd(cmds.cmd_MouseClickAtCursor)
-            self.go_to_end = False
+            conversation.go_to_end = False
 
     def goto_end(self, editor: Editor):
+        conversation = self.chats.by_editor(editor.get_prop(PROP_HANDLE_SELF))
+        if conversation is None:
+            return
         info = editor.get_prop(PROP_SCROLL_VERT_INFO)
         smooth_pos = info['smooth_pos']
         smooth_pos_last = info['smooth_pos_last']
         scroll_at_end = (abs(smooth_pos_last - smooth_pos) < 2)
 
-        if self.go_to_end and scroll_at_end:
+        if conversation.go_to_end and scroll_at_end:
             editor.cmd(cmds.cCommand_GotoTextEnd) # moves caret
 
         # if caret on last line
         last_line = editor.get_line_count()-1
         y = editor.get_carets()[0][1]
         if y == last_line:
-            self.go_to_end = True
+            conversation.go_to_end = True
         # if not, but scrolled to end with mouse wheel
         elif smooth_pos != 0 and scroll_at_end:
-            self.go_to_end = True
+            conversation.go_to_end = True
 
     def set_text(self, editor: Editor, question, text):
         editor.set_text_all('### User:\n{}\n\n### Bot:\n{}'.format(question, text))
@@ -527,11 +899,36 @@ class Command:
         editor.insert(last_line_len, last_line, text)
         self.goto_end(editor)
 
+    def render_chat(self, ed_handle, text):
+        editor = Editor(ed_handle)
+        if is_editor_valid(editor):
+            probe = self.chat_probes.get(ed_handle)
+            if probe:
+                t = time.perf_counter()
+                if probe.first_token is None:
+                    probe.first_token = probe.now()
+                probe.chars += len(text)
+
+            self.append_text(editor, text)
+
+            # answer which goes to file: keep only its last lines in the tab
+            first = self.chat_tails.get(ed_handle)
+            if first is not None:
+                count = editor.get_line_count()
+                if count - first > EXPORT_TAIL_LINES:
+                    editor.delete(0, first, 0, count - EXPORT_TAIL_LINES)
+                    self.goto_end(editor)
+
+            if probe:
+                probe.render += time.perf_counter() - t
+
     def Ask(self):
-        self.ask_command_was_triggered = True
         self._ask()
 
-    def _ask(self):
+    def Ask_to_file(self):
+        self._ask(to_file=True)
+
+    def _ask(self, to_file=False):
         if self.in_process_of_asking:
             return
 
@@ -539,186 +936,256 @@ class Command:
         try:
             if self.port is None:
                 self.log_in()
-            if self.port is not None:
+            if self.port is None:
+                # question is asked again when the server is ready
+                self.ask_command_was_triggered = True
+                self.ask_to_file = to_file
+            else:
                 if self.in_process_of_creating_new_tab:
-                    timer_proc(TIMER_START_ONE, lambda _: self._ask(), 100)
+                    timer_proc(TIMER_START_ONE, lambda _: self._ask(to_file), 100)
                 else:
+                    self.ask_command_was_triggered = False
+                    ed_handle = ed.get_prop(PROP_HANDLE_SELF)
                     def callback(question):
-                        if question:
-                            self.request_GetChatMessage(question)
+                        if not question:
+                            return
+                        target = None
+                        if to_file:
+                            target = dlg_input(_('Save answer to file (or "|command" to send it to command input):'), self.export_target)
+                            if not target:
+                                return
+                            self.export_target = target
+                        self.request_GetChatMessage(question, self.chats.for_question(ed_handle), target)
                     Dialog.input(callback)
         finally:
             self.in_process_of_asking = False
 
-    def request_GetChatMessage(self, question):
-        if self.in_process_of_answering:
-            self.cancel = True
-            timer_proc(TIMER_START_ONE, lambda _: self.request_GetChatMessage(question), 10)
+    def request_GetChatMessage(self, question, conversation, target=None):
+        if conversation.stream is not None:
+            # previous answer must be finished and saved to context first
+            self.cancel_chat(conversation)
+            timer_proc(TIMER_START_ONE, lambda _: self.request_GetChatMessage(question, conversation, target), 10)
             return
-        self.cancel = False
 
-        url = 'http://127.0.0.1:{}/exa.language_server_pb.LanguageServerService/GetChatMessage'.format(
-            self.port
-        )
+        probe = ChatProbe()
+        writer = None
+        if target:
+            try:
+                writer = AnswerWriter(target)
+            except OSError as e:
+                msg_box(_('Cannot write answer to "{}": {}').format(target, e), MB_OK+MB_ICONERROR)
+                return
 
-        from . import proto_pb2
+        builder = self.get_chat_request_builder()
+        history = conversation.history
+        message_id = history.new_id()
+        message = builder.user_message(conversation.id, message_id, question or '')
+        history.add_data(message_id, SOURCE_USER, message)
+        self.chat_store.append(conversation.id, message, title=question)
 
-        GetChatMessage_data = proto_pb2.GetChatMessageRequest()
-        GetChatMessage_data.prompt = question or ''
-
-        metadata = proto_pb2.Metadata()
-        metadata.api_key = self.api_key
-        metadata.ide_name = "vscode"
-        metadata.locale = "en"
-        metadata.ide_version = "Visual Studio Code 1.77.3"
-        metadata.extension_version = option_version
-        metadata.extension_name = "vscode"
-        metadata.session_id = SESSION_ID
-        #metadata.session_id = "50d517c6-ac4a-4d44-ab20-1d48e12ee70d"
-        GetChatMessage_data.metadata.CopyFrom(metadata)
-
-        from .google.protobuf.timestamp_pb2 import Timestamp
-        import datetime
-        now = datetime.datetime.now()
-        timestamp = Timestamp()
-        timestamp.FromDatetime(now)
-
-        chat_message = proto_pb2.ChatMessage()
-        chat_message.messageId = 'user-1'
-        chat_message.intent.generic.text = GetChatMessage_data.prompt
-        chat_message.source = 1
-        chat_message.timestamp.CopyFrom(timestamp)
-
-        unique_string = str(uuid.uuid4())
-        #chat_message.conversationId = unique_string
-        chat_message.conversationId = '8HTVPeFtS35MLqygNelEYA8Ky8Qd32jG'
-        self.messages.append(chat_message)
-        GetChatMessage_data.chat_messages.extend(self.messages)
-
-        data = GetChatMessage_data.SerializeToString()
-        compression_flag = b'\x00'
-        data = compression_flag + len(data).to_bytes(4, 'big') + data
+        # history is already serialized, repeated field is just appended
+        data = builder.request(question, history.encoded)
+        probe.build = probe.now()
 
         msg_status(_('{}: waiting for bot..').format(self.name), process_messages=True)
 
         self.in_process_of_asking = False
-        self.in_process_of_answering = True
-        messages = []
-        try:
-            response = requests.post(url, headers=HEADERS_GRPC_PROTO, data=data, timeout=8, stream=True)
-            response.raise_for_status()
-            error_count = 0
-            prev_text_len = 0
-
-            buffer = bytearray()
-            for i, data in enumerate(response.iter_content(chunk_size=8192)):
-                if self.cancel:
-                    if messages: # partial answer must be saved to context as well
-                        self.messages.append(messages[-1].chat_message)
-                    raise CancelException
-
-                buffer.extend(data)
-
-                if len(buffer) >= 4:
-                    message_size = int.from_bytes(buffer[1:5], byteorder='big')
-                    if len(buffer) >= message_size + 5:
-                        message_data = buffer[5:message_size + 5]
-                        buffer = buffer[message_size + 5:]
-
-                        msg = None
-                        try:
-                            ## ====== for debugging binary data
-                            #print(message_data)
-                            #script_dir = os.path.dirname(os.path.abspath(__file__))
-                            #file_path = os.path.join(script_dir, "binary_file.protobuf")
-                            #with open(file_path, "wb") as binary_file:
-                            #    binary_file.write(message_data)
-                                
-                            msg = proto_pb2.GetChatMessageResponse().FromString(message_data)
-                        except Exception as e:
-                            print("ERROR:", e)
-                            error_count += 1
-                            if error_count > 2:
-                                print("ERROR: too many errors, aborting task.")
-                                return
-                            continue
-                        
-                        if not msg.chat_message.conversationId: # not a conversation message, skip
-                            continue
-
-                        messages.append(msg)
-                        editor = self.get_editor(msg.chat_message.conversationId, question)
-                        if not is_editor_valid(editor):
-                            raise CancelException
-                        editor.set_prop(PROP_CARET_VIEW, '-100,-100')
-                        if i == 0:
-                            editor.focus()
-                            self.update_tab_title(editor, question)
-                        from .google.protobuf.internal import decoder
-                        buf = messages[-1].chat_message.action.text
-                        if buf:
-                            # first byte is '\n' for some reason. some kind of mark?
-                            buf = buf[1:] # skip it
-                            # next we have varint? seems it's text size? what for? decode it and skip
-                            varint, varint_len = decoder._DecodeVarint(buf, 0)
-                            buf = buf[varint_len:]
-                        elif msg.chat_message.error.message:
-                            buf = msg.chat_message.error.message.encode('utf-8')
-                        text = buf.decode('utf-8', errors='replace')
-                        if option_append_mode:
-                            if i == 0:
-                                if editor.get_line_count() > 1:
-                                    self.append_text(editor, '\n\n')
-                                self.go_to_end = True
-                                editor.cmd(cmds.cCommand_GotoTextEnd)
-                                self.append_text(editor, '### User:\n{}\n\n### Bot:\n'.format(question))
-                            self.append_text(editor, text[prev_text_len:])
-                            prev_text_len = len(text)
-                        else:
-                            self.set_text(editor, question, text)
-                        app_idle()
-
-            if not messages:
-                msg_status(_('{}: no answer :(').format(self.name), process_messages=True)
+        stream = ChatStream(self.client, data, HEADERS_GRPC_PROTO, writer=writer, probe=probe)
+        stream.question = question
+        stream.editor = None
+        self.chats.start(conversation, stream)
+        self.renderer.start()
+
+    def get_chat_request_builder(self):
+        metadata = dict(
+            api_key=self.api_key or '',
+            ide_name="vscode",
+            locale="en",
+            ide_version="Visual Studio Code 1.77.3",
+            extension_version=option_version,
+            extension_name="vscode",
+            session_id=SESSION_ID,
+        )
+        # api key can change after logging in again
+        if self.chat_request_builder is None or self.chat_request_builder.key != tuple(sorted(metadata.items())):
+            self.chat_request_builder = ChatRequestBuilder(**metadata)
+        return self.chat_request_builder
+
+    def run_chat_stream(self, stream):
+        # own thread, not the dispatcher: a stream lasts as long as the answer,
+        # completions and heartbeats must not wait behind it. ConversationManager
+        # limits the number of streams (chat_streams option)
+        threading.Thread(target=stream.run, name='codeium-chat', daemon=True).start()
+
+    def poll_chat(self):
+        '''
+        Called by render timer: takes decoded parts of answers from the workers.
+        '''
+        for conversation in self.chats.streams():
+            stream = conversation.stream
+            while True:
+                try:
+                    event = stream.events.get_nowait()
+                except queue.Empty:
+                    break
+                if event is None:
+                    self.finish_chat(conversation, stream)
+                    break
+                if not stream.cancelled:
+                    self.show_chat_part(conversation, stream, *event)
+        return bool(self.chats.streams())
+
+    def show_chat_part(self, conversation, stream, conversation_id, text, reset):
+        question = stream.question
+        editor = self.get_editor(conversation, question)
+        if not is_editor_valid(editor):
+            self.cancel_chat(conversation)
+            return
+        h = editor.get_prop(PROP_HANDLE_SELF)
+        editor.set_prop(PROP_CARET_VIEW, '-100,-100')
+        if stream.editor is None:
+            stream.editor = editor
+            editor.focus()
+            self.update_tab_title(editor, question)
+            if option_append_mode:
+                if editor.get_line_count() > 1:
+                    self.append_text(editor, '\n\n')
+                conversation.go_to_end = True
+                editor.cmd(cmds.cCommand_GotoTextEnd)
+                self.append_text(editor, '### User:\n{}\n\n### Bot:\n'.format(question))
+            else:
+                self.set_text(editor, question, '')
+            self.chat_probes[h] = stream.probe
+            if stream.writer is not None:
+                self.chat_tails[h] = editor.get_line_count() - 1
+                msg_status(_('{}: writing answer to "{}"').format(self.name, stream.writer.target))
+        elif reset and not option_append_mode:
+            # answer was not continued but replaced, rare
+            self.renderer.discard(h)
+            self.set_text(editor, question, '')
+        # drawn by timer, together with next parts
+        self.renderer.add(h, text)
+
+    def finish_chat(self, conversation, stream):
+        from . import proto_pb2
+
+        self.chats.finish(conversation)
+        if stream.writer is not None:
+            try:
+                stream.writer.close() # stream could be canceled before it was started
+            except OSError as e:
+                stream.error = stream.error or str(e)
+        if stream.error:
+            print("ERROR: GetChatMessage failed:", stream.error)
+        stream.probe.cancelled = stream.cancelled
+        stream.probe.error = stream.error
+        # partial answer must be saved to context as well
+        self.save_answer(conversation, stream, proto_pb2)
+        if not stream.cancelled:
+            if stream.assembler.frames and stream.writer is not None:
+                msg_status(_('{}: answer saved to "{}"').format(self.name, stream.writer.target))
+            elif stream.assembler.frames:
+                msg_status(_('{}: answer recieved').format(self.name))
             else:
-                msg_status(_('{}: answer recieved').format(self.name), process_messages=True)
-                self.messages.append(messages[-1].chat_message)
+                msg_status(_('{}: no answer :(').format(self.name))
+
+        def sub(*args, **kwargs):
+            if conversation.stream is None:
+                conversation.answering = False
+        timer_proc(TIMER_START_ONE, sub, 2000) # 2000 ~ py_caret_slow
+
+        editor = stream.editor
+        if editor is not None and is_editor_valid(editor):
+            self.renderer.flush(editor.get_prop(PROP_HANDLE_SELF))
+            self.chat_tails.pop(editor.get_prop(PROP_HANDLE_SELF), None)
+            self.chat_probes.pop(editor.get_prop(PROP_HANDLE_SELF), None)
+            editor.set_prop(PROP_CARET_VIEW, self.caret_view)
+            editor.set_prop(PROP_MODIFIED, False)
+            for line in range(editor.get_line_count()):
+                editor.set_prop(PROP_LINE_STATE, (line, LINESTATE_NORMAL))
+
+        self.stats.add(stream.probe)
+
+    def show_stats(self):
+        msg_box(self.stats.summary(), MB_ICONINFO)
+
+    def cancel_chat(self, conversation):
+        '''
+        Stop the answer immediately. Already received part is kept.
+        '''
+        stream = conversation.stream
+        if stream is None or stream.cancelled:
             return
+        self.chats.cancel(conversation)
+        if stream.editor is not None:
+            self.renderer.flush(stream.editor.get_prop(PROP_HANDLE_SELF))
+
+    def save_answer(self, conversation, stream, proto_pb2):
+        answer = None
+        if stream.writer is not None:
+            # text was not kept, don't send it with next questions either
+            answer = '(answer was saved to file)'
+        message = stream.assembler.message(proto_pb2, answer)
+        if message is not None:
+            self.chat_store.append(conversation.id, conversation.history.add(message))
+
+    def open_chat(self):
+        from . import proto_pb2
 
-        except requests.exceptions.Timeout:
-            print("ERROR: GetChatMessage failed: The request timed out.")
+        items = self.chat_store.conversations()
+        if not items:
+            msg_status(_('{}: no saved chats').format(self.name))
             return
-        except requests.exceptions.RequestException as e:
-            print("ERROR: GetChatMessage failed. Error:", e)
+        titles = [title.replace('\n', ' ')[:100] or conversation_id for conversation_id, title in items]
+        res = dlg_menu(DMENU_LIST, titles, caption=_('Open chat'))
+        if res is None:
             return
-        except CancelException:
-            #print("ERROR: User canceled request.")
-            pass
-        finally:
-            self.cancel = False
+        conversation_id, title = items[res]
 
-            def sub(*args, **kwargs):
-                self.in_process_of_answering = False
-            timer_proc(TIMER_START_ONE, sub, 2000) # 2000 ~ py_caret_slow
+        conversation = self.chats.conversations.get(conversation_id)
+        if conversation is not None and conversation.ed_handle:
+            Editor(conversation.ed_handle).focus()
+            return
 
-            if messages and is_editor_valid(editor):
-                editor.set_prop(PROP_CARET_VIEW, self.caret_view)
-                editor.set_prop(PROP_MODIFIED, False)
-                for line in range(editor.get_line_count()):
-                    editor.set_prop(PROP_LINE_STATE, (line, LINESTATE_NORMAL))
+        conversation = self.chats.restore(conversation_id)
+        # history of a conversation which is still in memory is newer than on disk
+        load_history = not conversation.history.items
+        messages = {}
+        for data in self.chat_store.read_tail(conversation_id, option_chat_history_bytes):
+            message = proto_pb2.ChatMessage.FromString(data)
+            if load_history:
+                conversation.history.add_data(message.messageId, message.source, data)
+            messages[message.messageId] = message # answer can be saved several times, keep the last
+
+        parts = []
+        for message in messages.values():
+            if message.source == SOURCE_USER:
+                parts.append('### User:\n{}\n\n'.format(message.intent.generic.text))
+            elif message.HasField('action'):
+                parts.append('### Bot:\n{}\n\n'.format(answer_text(message.action.text)))
+            elif message.HasField('error'):
+                parts.append('### Bot:\n{}\n\n'.format(message.error.message))
+
+        editor = self.get_editor(conversation, title)
+        if not is_editor_valid(editor):
+            return
+        editor.set_text_all(''.join(parts).rstrip('\n'))
+        editor.set_prop(PROP_MODIFIED, False)
+        editor.focus()
+        editor.cmd(cmds.cCommand_GotoTextEnd)
 
     def update_tab_title(self, editor, title):
         title = title.replace('\n', ' ')[:50]
         editor.set_prop(PROP_TAB_TITLE, 'Bot | {}'.format(title))
 
-    def get_editor(self, conversation_id, question):
-        ed_handle = self.conversations.get(conversation_id, None)
+    def get_editor(self, conversation, question):
+        ed_handle = conversation.ed_handle
         if not ed_handle:
             self.in_process_of_creating_new_tab = True
             file_open('')
             if ed.get_filename('*') == '' and ed.get_text_all() == '': # ensure we are at correct tab
                 ed_handle = ed.get_prop(PROP_HANDLE_SELF)
-                self.conversations[conversation_id] = ed_handle
+                conversation.ed_handle = ed_handle
                 self.in_process_of_creating_new_tab = False
 
                 self.update_tab_title(ed, question)
@@ -729,25 +1196,23 @@ class Command:
                 ed.set_prop(PROP_TAG, 'codeium:chat')
         return Editor(ed_handle)
 
-    def request_completions(self, *args):
-        if self.port is None:
-            print(_("ERROR: Can't get completions: server is not started."))
-            return
-
-        url = 'http://127.0.0.1:{}/exa.language_server_pb.LanguageServerService/GetCompletions'.format(
-            self.port
-        )
-
-        self.text = ed.get_text_all()
+    def build_completions_request(self):
+        '''
+        Collect document state for GetCompletions. Runs on the UI thread.
+        '''
         self.col, self.row = ed.get_carets()[0][:2]
         line_len = ed.get_line_len(self.row)
         if line_len is None:
-            return # fix TypeError: '>' not supported between instances of 'NoneType' and 'int'
+            return None, 0 # fix TypeError: '>' not supported between instances of 'NoneType' and 'int'
         if line_len > 0 and self.col > line_len:
            self.col = line_len
 
+        # only window around the caret is sent, positions are relative to it
+        self.text, first_row = self.docsync.get_text(ed, self.row)
+
         lexer = ed.get_prop(PROP_LEXER_FILE)
         lang =  language_enum.get(lex_ids.get(lexer,'plaintext'), 30)
+        other_documents = self.context.get_documents(ed.get_prop(PROP_HANDLE_SELF), lexer)
         lexer = lexer or 'plaintext'
         
         absolute_path = pathlib.Path(ed.get_filename())
@@ -759,13 +1224,15 @@ class Command:
                 'ide_name': 'vscode',
                 'ide_version': '1.77.3',
                 'extension_version': option_version,
+                # request_id is unique only within our process, the server can be shared
+                'session_id': SESSION_ID,
                 },
             'document': {
                 'text': self.text,
                 'editor_language': lexer,
                 'language': lang,
                 'cursor_position': {
-                    'row': self.row,
+                    'row': self.row - first_row,
                     'col': self.col,
                 },
                 'absolute_path': absolute_path, #needed from 1.12.6 to 1.14.12
@@ -776,10 +1243,28 @@ class Command:
                 'tab_size': ed.get_prop(PROP_TAB_SIZE),
                 'insert_spaces': ed.get_prop(PROP_TAB_SPACES),
             },
-            #'other_documents': {},
+            'other_documents': other_documents,
         }
+        return data, first_row
+
+    def request_completions(self, data):
+        '''
+        Send GetCompletions request. Runs in background thread.
+        '''
+        if self.port is None:
+            print(_("ERROR: Can't get completions: server is not started."))
+            return
+
+        if self.completion_transport == 'proto':
+            try:
+                return self.request_completions_proto(data)
+            except ProtoUnsupportedException as e:
+                # old server or changed schema, use JSON from now on
+                pass;      LOG and print("ERROR: binary completions failed, fallback to JSON:", e)
+                self.completion_transport = 'json'
+
         try:
-            response = requests.post(url, headers=HEADERS_JSON, data=json.dumps(data), timeout=4)
+            response = self.client.post('GetCompletions', json.dumps(data), HEADERS_JSON, timeout=4)
             ## ==== for debugging
             #if response.status_code  != 200:
             #    print("ERROR: Can't get codeium completions:  status: {}, response: {}".format(response.status_code, response.json()))
@@ -800,17 +1285,71 @@ class Command:
         items = result_json.get('completionItems', [])
         return items
 
+    def request_completions_proto(self, data):
+        '''
+        Send GetCompletions request as binary protobuf. Runs in background thread.
+        Items are returned in the same form as JSON transport gives them.
+        '''
+        from . import proto_pb2
+        # the same google.protobuf which proto_pb2 is built on (plugin folder is in sys.path),
+        # '.google.protobuf' would be another copy of the module with other exception classes
+        from google.protobuf import json_format
+        from google.protobuf.message import DecodeError
+
+        try:
+            request = dict_to_message(data, proto_pb2.GetCompletionsRequest())
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ProtoUnsupportedException(e)
+        try:
+            response = self.client.post('GetCompletions', request.SerializeToString(), HEADERS_PROTO, timeout=4)
+            if response.status_code in (400, 415):
+                raise ProtoUnsupportedException(response.status_code)
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            return
+
+        try:
+            result = proto_pb2.GetCompletionsResponse.FromString(response.content)
+        except DecodeError as e:
+            raise ProtoUnsupportedException(e)
+
+        result_json = json_format.MessageToDict(result)
+        items = result_json.get('completionItems', [])
+        return items
+
+    def request_cancel(self, request_id, metadata):
+        '''
+        Ask server to abort request which was superseded. Runs in background thread.
+        '''
+        data = {
+            'metadata': metadata,
+            'request_id': request_id,
+        }
+        try:
+            self.client.post('CancelRequest', json.dumps(data), HEADERS_JSON, timeout=1)
+        except requests.exceptions.RequestException:
+            pass
+
     def shutdown(self, *args, **vargs):
         msg_status(_('{}: Shutting down').format(self.name))
 
         self.shutting_down = True
+        self.scheduler.cancel_all()
+        self.prefetcher.cancel()
         self.port = None
+        self.client.port = None
         timer_proc(TIMER_STOP,  self.heartbeat, 5000)
+        timer_proc(TIMER_STOP,  self.on_restart_timer, 0)
+        self.requeue.clear()
+        self.supervisor.stop()
+        self.in_process_of_logging_in = False
 
-        if self.process:
-            self.process.terminate()
-            self.process.wait()
+        # shared server is stopped by the last instance which uses it
+        if self.shared_pid is not None and not self.shared.leave(os.getpid(), self.shared_pid):
             self.process = None
+        else:
+            self.kill_server()
+        self.shared_pid = None
 
     def show_versions(self):
         url = 'https://marketplace.visualstudio.com/_apis/public/gallery/extensionquery'
@@ -841,57 +1380,80 @@ class Command:
 
     def on_close(self, ed_self: Editor):
         '''
-        Remove conversation from dict when the tab is closed.
+        Forget conversation when the tab is closed.
         '''
         ed_h = ed_self.get_prop(PROP_HANDLE_SELF)
-        to_pop = [k for k, v in self.conversations.items() if v == ed_h]
 
-        for conversation_id in to_pop:
-            self.conversations.pop(conversation_id, None)
+        self.scheduler.cancel(ed_h)
+        self.debouncer.forget(ed_h)
+        self.cache.forget(ed_h)
+        self.docsync.forget(ed_h)
+        self.context.forget(ed_h)
 
-        if to_pop:
-            self.cancel = True
+        self.renderer.discard(ed_h)
+        self.chats.forget(ed_h)
 
     def on_exit(self, ed_self):
+        # running workers are not stopped by dispatcher.shutdown(), and the
+        # interpreter waits for them: abort the answers and the download
+        for conversation in self.chats.streams():
+            self.cancel_chat(conversation)
+        # render timer won't run anymore: save the answers now
+        self.poll_chat()
+        for conversation in self.chats.streams():
+            self.finish_chat(conversation, conversation.stream)
+        # queued writes are dropped by dispatcher.shutdown()
+        try:
+            self.chat_store.flush()
+        except OSError as e:
+            print("ERROR: cannot save chats:", e)
+        self.download_stop.set()
         self.shutdown()
+        self.dispatcher.shutdown()
+        self.client.close()
 
     def on_key(self, ed_self, key, state):
-        if self.in_process_of_answering and key in (13, 27, 32):
-            ed_h = ed_self.get_prop(PROP_HANDLE_SELF)
-            if ed_h in self.conversations.values():
-                self.cancel = True
+        conversation = self.chats.by_editor(ed_self.get_prop(PROP_HANDLE_SELF))
+        if conversation is not None and conversation.answering and key in (13, 27, 32):
+            if conversation.stream is not None:
+                self.cancel_chat(conversation)
                 msg_status(_('{}: User canceled request.').format(self.name))
         elif key == 27:
             self.hide_hint()
         elif key == 9 and option_tab_completion:
             if self.completions and self.completion_allowed:
-                item = self.completions[0]
-
-                new_caret = ed_self.replace(
-                    item.start_position[0],
-                    item.start_position[1],
-                    item.end_position[0],
-                    item.end_position[1],
-                    item.text + item.suffix
-                )
-
-                if item.cursor_offset:
-                    offset = ed_self.convert(CONVERT_CARET_TO_OFFSET, new_caret[0], new_caret[1])
-                    offset += item.cursor_offset
-                    new_caret = ed_self.convert(CONVERT_OFFSET_TO_CARET, offset, 0)
-                    new_caret = (new_caret[0], new_caret[1], -1, -1)
-
-                ed_self.set_caret(*new_caret)
-
+                self.insert_completion(ed_self, self.completions[0])
                 self.hide_hint()
                 return False
 
+    def on_change(self, ed_self):
+        # called on every edit, must be cheap
+        ed_h = ed_self.get_prop(PROP_HANDLE_SELF)
+        caret = tuple(ed_self.get_carets()[0][:2])
+        self.cache.on_edit(ed_h, caret[1], self.get_line_prefix(ed_self, caret))
+
+        # debouncer sees the typing cadence and sends the request itself
+        if option_tab_completion and not self.chats.answering(ed_h):
+            self.debouncer.on_change(ed_h)
+
     def on_change_slow(self, ed_self):
-        if option_tab_completion and not self.in_process_of_answering:
+        ed_h = ed_self.get_prop(PROP_HANDLE_SELF)
+        self.scheduler.cancel_speculative(ed_h)
+        self.cache.drop_speculative(ed_h)
+
+    def on_debounced(self, ed_handle):
+        # user could switch tab while we were waiting
+        if ed.get_prop(PROP_HANDLE_SELF) == ed_handle:
             self.get_completions(use_hint=True)
 
     def on_caret(self, ed_self):
         self.hide_hint()
+        self.docsync.on_caret(ed_self)
+        if self.port is not None:
+            self.prefetcher.on_caret(ed_self.get_prop(PROP_HANDLE_SELF), tuple(ed_self.get_carets()[0][:2]))
+
+    def on_focus(self, ed_self):
+        self.context.on_focus(ed_self.get_prop(PROP_HANDLE_SELF))
 
     def on_start2(self, ed_self):
         self.log_in()
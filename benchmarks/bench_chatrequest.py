@@ -0,0 +1,117 @@
+'''
+Cost of building GetChatMessage request: old code (protobuf objects, CopyFrom,
+Timestamp) vs ChatRequestBuilder (wire format, metadata serialized once).
+Run from the plugin folder:
+    python benchmarks/bench_chatrequest.py
+Both ways must give byte-identical requests for the same inputs, it is checked first.
+Needs requests module (imported by chatstream).
+'''
+import os
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT) # proto_pb2 uses bundled google.protobuf
+package = types.ModuleType('cuda_codeium') # without __init__.py, it needs CudaText
+package.__path__ = [ROOT]
+sys.modules['cuda_codeium'] = package
+
+from google.protobuf.timestamp_pb2 import Timestamp
+from cuda_codeium import proto_pb2
+from cuda_codeium.frames import frame
+from cuda_codeium.chathistory import ChatHistory
+from cuda_codeium.chatrequest import ChatRequestBuilder
+
+METADATA = dict(
+    api_key='0123456789abcdef-0123-4567-89ab-cdef01234567',
+    ide_name='vscode',
+    locale='en',
+    ide_version='Visual Studio Code 1.77.3',
+    extension_version='1.8.80',
+    extension_name='vscode',
+    session_id='50d517c6-ac4a-4d44-ab20-1d48e12ee70d',
+)
+CONVERSATION_ID = 'conversation-id'
+QUESTION = 'How do I read a file line by line in Python, without loading it into memory? '
+ANSWER = 'Iterate over the file object: `for line in f:` reads one line at a time. '
+REPEAT = 2000
+
+def make_history(turns):
+    history = ChatHistory(max_bytes=10**9)
+    builder = ChatRequestBuilder(**METADATA)
+    for i in range(turns):
+        message_id = history.new_id()
+        history.add_data(message_id, 1, builder.user_message(CONVERSATION_ID, message_id, QUESTION * 3, 10**18))
+        answer = proto_pb2.ChatMessage()
+        answer.messageId = 'bot-{}'.format(i)
+        answer.source = 2
+        answer.conversationId = CONVERSATION_ID
+        answer.action.text = proto_pb2.Generic(text=ANSWER * 20).SerializeToString()
+        history.add(answer)
+    return history
+
+def old_request(history, question, time_ns):
+    '''
+    Previous code of request_GetChatMessage.
+    It took the time from datetime.now(), here it is given for the comparison.
+    '''
+    request = proto_pb2.GetChatMessageRequest()
+    request.prompt = question or ''
+
+    metadata = proto_pb2.Metadata()
+    metadata.api_key = METADATA['api_key']
+    metadata.ide_name = METADATA['ide_name']
+    metadata.locale = METADATA['locale']
+    metadata.ide_version = METADATA['ide_version']
+    metadata.extension_version = METADATA['extension_version']
+    metadata.extension_name = METADATA['extension_name']
+    metadata.session_id = METADATA['session_id']
+    request.metadata.CopyFrom(metadata)
+
+    timestamp = Timestamp()
+    timestamp.FromNanoseconds(time_ns)
+
+    chat_message = proto_pb2.ChatMessage()
+    chat_message.messageId = history.new_id()
+    chat_message.intent.generic.text = request.prompt
+    chat_message.source = 1
+    chat_message.timestamp.CopyFrom(timestamp)
+    chat_message.conversationId = CONVERSATION_ID
+    history.add(chat_message)
+    return frame(request.SerializeToString() + b''.join(history.encoded))
+
+def new_request(history, question, time_ns, builder=ChatRequestBuilder(**METADATA)):
+    message_id = history.new_id()
+    history.add_data(message_id, 1, builder.user_message(CONVERSATION_ID, message_id, question or '', time_ns))
+    return builder.request(question, history.encoded)
+
+def measure(fn, turns):
+    history = make_history(turns)
+    start = time.perf_counter()
+    for i in range(REPEAT):
+        fn(history, QUESTION, 1700000000123456789 + i)
+        # keep the history size, only the request is measured
+        message_id, __ = history.items.pop()
+        del history.ids[message_id]
+        history.size -= len(history.encoded.pop())
+    return (time.perf_counter() - start) / REPEAT
+
+def main():
+    for turns in (0, 1, 10):
+        for time_ns in (1700000000123456789, 1700000000000000000):
+            old = old_request(make_history(turns), QUESTION, time_ns)
+            new = new_request(make_history(turns), QUESTION, time_ns)
+            assert old == new, 'requests differ: {} turns'.format(turns)
+    print('old and new requests are byte-identical')
+
+    print('{:<10}{:>14}{:>14}{:>14}{:>10}'.format('history', 'request KB', 'old, us', 'new, us', 'speedup'))
+    for turns in (0, 5, 20, 50):
+        size = len(new_request(make_history(turns), QUESTION, 0)) / 1024
+        old_time = min(measure(old_request, turns) for i in range(3))
+        new_time = min(measure(new_request, turns) for i in range(3))
+        print('{:<10}{:>14.1f}{:>14.1f}{:>14.1f}{:>9.1f}x'.format(
+            '{} turns'.format(turns), size, old_time * 1e6, new_time * 1e6, old_time / new_time))
+
+if __name__ == '__main__':
+    main()
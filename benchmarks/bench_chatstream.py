@@ -0,0 +1,101 @@
+'''
+Throughput of chat stream decoding: frame splitting and answer assembling.
+Run from the plugin folder:
+    python benchmarks/bench_chatstream.py [recorded_stream ...]
+recorded_stream is raw body of GetChatMessage response (sequence of gRPC frames).
+Without arguments, streams are generated the way the server sends them:
+one frame per token, every frame carries the whole answer so far.
+Needs requests module (imported by chatstream).
+'''
+import os
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT) # proto_pb2 uses bundled google.protobuf
+package = types.ModuleType('cuda_codeium') # without __init__.py, it needs CudaText
+package.__path__ = [ROOT]
+sys.modules['cuda_codeium'] = package
+
+from cuda_codeium import proto_pb2
+from cuda_codeium.frames import FrameDecoder, frame
+from cuda_codeium.chatstream import ChatStreamAssembler, encode_len_field, read_varint
+
+CHUNK_SIZE = 8192
+TOKEN = 'слово word 🙂 '.encode('utf-8') # ~4 bytes per token, with multibyte chars
+
+def generate(size):
+    answer = (TOKEN * (size // len(TOKEN) + 1))[:size]
+    frames = []
+    for n in range(4, size + 4, 4):
+        text = encode_len_field(1, answer[:n])
+        message = (encode_len_field(1, b'bot-1') + encode_len_field(4, b'conversation-id')
+                   + encode_len_field(6, encode_len_field(1, text)))
+        frames.append(frame(encode_len_field(1, message)))
+    return b''.join(frames)
+
+def chunks(stream):
+    return [stream[i:i+CHUNK_SIZE] for i in range(0, len(stream), CHUNK_SIZE)]
+
+def old_decoder(stream):
+    '''
+    Previous code: buffer is resliced for every frame, whole message is parsed
+    and whole answer is decoded per frame (all frames are drained here,
+    old code took at most one frame per chunk and fell behind).
+    '''
+    buffer = bytearray()
+    text = ''
+    for data in chunks(stream):
+        buffer.extend(data)
+        while len(buffer) >= 5:
+            size = int.from_bytes(buffer[1:5], 'big')
+            if len(buffer) < size + 5:
+                break
+            message_data = buffer[5:size + 5]
+            buffer = buffer[size + 5:]
+            msg = proto_pb2.GetChatMessageResponse.FromString(bytes(message_data))
+            buf = msg.chat_message.action.text
+            # skip key and size of Generic.text, as the old code did
+            size, pos = read_varint(buf, 1)
+            text = buf[pos:].decode('utf-8', errors='replace')
+    return text
+
+def new_decoder(stream):
+    decoder = FrameDecoder()
+    assembler = ChatStreamAssembler()
+    for data in chunks(stream):
+        for payload in decoder.feed(data):
+            assembler.feed(payload)
+    return assembler.text()
+
+def best(fn, arg, repeat=3):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    if sys.argv[1:]:
+        streams = []
+        for fn in sys.argv[1:]:
+            with open(fn, 'rb') as f:
+                streams.append((os.path.basename(fn), f.read()))
+    else:
+        streams = [('answer {} KB'.format(size // 1024), generate(size)) for size in (2048, 8192, 32768)]
+
+    print('{:<18}{:>8}{:>12}{:>14}{:>14}{:>10}'.format('stream', 'frames', 'stream MB', 'old, MB/s', 'new, MB/s', 'speedup'))
+    for caption, stream in streams:
+        frames = sum(1 for __ in FrameDecoder().feed(stream))
+        mb = len(stream) / (1024 * 1024)
+        old_time, old_text = best(old_decoder, stream)
+        new_time, new_text = best(new_decoder, stream)
+        # last frame ends on a char boundary, so both give the same text
+        assert old_text == new_text
+        print('{:<18}{:>8}{:>12.2f}{:>14.1f}{:>14.1f}{:>9.1f}x'.format(
+            caption, frames, mb, mb / old_time, mb / new_time, old_time / new_time))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+Latency of local RPC: new connection per request (bare requests.post)
+vs keep-alive pool of LanguageServerClient, against fake language server.
+Run from the plugin folder: python benchmarks/bench_client.py
+'''
+import os
+import sys
+import time
+import types
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+package = types.ModuleType('cuda_codeium') # without __init__.py, it needs CudaText
+package.__path__ = [ROOT]
+sys.modules['cuda_codeium'] = package
+
+from cuda_codeium.client import LanguageServerClient, SERVICE_PATH
+
+REQUESTS = 500
+BURST = 4 # parallel completions, as when on_change_slow fires in bursts
+BODY = b'{"completionItems": []}'
+HEADERS_JSON = {'Content-Type': 'application/json'}
+
+class FakeServer(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, as the language server
+    # Go sets TCP_NODELAY too. without it headers and body are sent separately,
+    # and the body waits for delayed ACK (40 ms) on reused connections
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+def percentiles(times):
+    times = sorted(t * 1000 for t in times)
+    return times[len(times) // 2], times[int(len(times) * 0.9)], times[int(len(times) * 0.99)]
+
+def run(post, threads=1):
+    times = []
+    lock = threading.Lock()
+    def worker(count):
+        for i in range(count):
+            start = time.perf_counter()
+            response = post()
+            response.raise_for_status()
+            response.content
+            with lock:
+                times.append(time.perf_counter() - start)
+    workers = [threading.Thread(target=worker, args=(REQUESTS // threads,)) for i in range(threads)]
+    for w in workers: w.start()
+    for w in workers: w.join()
+    return percentiles(times)
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    url = 'http://127.0.0.1:{}{}GetCompletions'.format(port, SERVICE_PATH)
+    data = '{"metadata": {}, "document": {"text": "%s"}}' % ('x' * 4000)
+
+    client = LanguageServerClient()
+    client.port = port
+    cases = (
+        ('requests.post', lambda: requests.post(url, headers=HEADERS_JSON, data=data, timeout=4)),
+        ('client.post', lambda: client.post('GetCompletions', data, HEADERS_JSON, timeout=4)),
+    )
+    print('{:<26}{:>12}{:>12}{:>12}'.format('{} requests'.format(REQUESTS), 'p50, ms', 'p90, ms', 'p99, ms'))
+    for threads in (1, BURST):
+        for caption, post in cases:
+            post() # warm up: imports, first connection
+            print('{:<26}{:>12.3f}{:>12.3f}{:>12.3f}'.format(
+                '{}, {} thread(s)'.format(caption, threads), *run(post, threads)))
+    client.close()
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
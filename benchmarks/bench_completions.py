@@ -0,0 +1,80 @@
+'''
+Client CPU time of GetCompletions encoding: JSON vs binary protobuf.
+Run from the plugin folder: python benchmarks/bench_completions.py
+'''
+import os
+import sys
+import json
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT) # proto_pb2 uses bundled google.protobuf
+
+import proto_pb2
+from google.protobuf import json_format
+from protoutil import dict_to_message
+
+SIZES = (('10 KB', 10 * 1024), ('1 MB', 1024 * 1024), ('10 MB', 10 * 1024 * 1024))
+
+# quotes, backslashes, tabs and non-ASCII: what makes JSON escaping slow
+SAMPLE = 'def f(s):\n\tprint("path: C:\\\\temp\\\\{}", s)  # \u043a\u043e\u043c\u043c\u0435\u043d\u0442\u0430\u0440\u0438\u0439\n'
+
+def make_request(size):
+    text = (SAMPLE * (size // len(SAMPLE.encode('utf-8')) + 1))[:size]
+    return {
+        'metadata': {
+            'api_key': 'x' * 36,
+            'ide_name': 'vscode',
+            'ide_version': '1.77.3',
+            'extension_version': '1.48.2',
+            'request_id': 1,
+            },
+        'document': {
+            'text': text,
+            'editor_language': 'python',
+            'language': 33,
+            'cursor_position': {'row': 10, 'col': 4},
+            'absolute_path': 'file:///tmp/a.py',
+            'absolute_uri': 'file:///tmp/a.py',
+        },
+        'editor_options': {'tab_size': 4, 'insert_spaces': True},
+        'other_documents': [],
+    }
+
+def make_response():
+    items = [{
+        'completion': {'completionId': str(i), 'text': SAMPLE * 5, 'score': 0.5},
+        'range': {'startOffset': '100', 'endOffset': '120'},
+        'completionParts': [{'text': SAMPLE, 'offset': '100', 'type': 'COMPLETION_PART_TYPE_INLINE', 'line': '10'}],
+    } for i in range(3)]
+    response = json_format.ParseDict({'completionItems': items}, proto_pb2.GetCompletionsResponse())
+    return json.dumps({'completionItems': items}).encode('utf-8'), response.SerializeToString()
+
+def best(fn, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+def main():
+    print('{:<8}{:>14}{:>14}{:>16}{:>12}{:>12}'.format('doc', 'json enc, ms', 'proto enc, ms', 'ParseDict, ms', 'json bytes', 'proto bytes'))
+    for caption, size in SIZES:
+        data = make_request(size)
+        repeat = 20 if size < 1024 * 1024 else 5
+        json_ms = best(lambda: json.dumps(data).encode('utf-8'), repeat)
+        proto_ms = best(lambda: dict_to_message(data, proto_pb2.GetCompletionsRequest()).SerializeToString(), repeat)
+        parse_dict_ms = best(lambda: json_format.ParseDict(data, proto_pb2.GetCompletionsRequest()).SerializeToString(), repeat)
+        json_size = len(json.dumps(data).encode('utf-8'))
+        proto_size = len(dict_to_message(data, proto_pb2.GetCompletionsRequest()).SerializeToString())
+        print('{:<8}{:>14.2f}{:>14.2f}{:>16.2f}{:>12}{:>12}'.format(caption, json_ms, proto_ms, parse_dict_ms, json_size, proto_size))
+
+    json_data, proto_data = make_response()
+    json_ms = best(lambda: json.loads(json_data).get('completionItems', []), 200)
+    proto_ms = best(lambda: json_format.MessageToDict(
+        proto_pb2.GetCompletionsResponse.FromString(proto_data)).get('completionItems', []), 200)
+    print('\nresponse with 3 items: json parse {:.3f} ms, proto parse {:.3f} ms'.format(json_ms, proto_ms))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+from collections import OrderedDict
+
+def _rep_chars(text):
+    return text.replace('\n',' ').replace('\t',' ')
+
+def make_hint(text, text_inline, text_block):
+    '''
+    One-line text of completion, for the list of completions.
+    '''
+    if text_inline:
+        hint = _rep_chars(text_inline) + ' ' + _rep_chars(text_block)
+    else:
+        hint = _rep_chars(text)
+    return hint.strip()
+
+def _trim(item, row, line_prefix, typed):
+    '''
+    Cut already typed text from the beginning of the completion item,
+    which was received for the caret at the end of line_prefix.
+    Returns None if the item does not continue with the typed text.
+    '''
+    start_col, start_row = item.start_position
+    end_col, end_row = item.end_position
+    if start_row != row or start_col > len(line_prefix):
+        return None
+
+    # completion replaces range which begins before the caret, skip that part
+    covered = line_prefix[start_col:]
+    if not item.text.startswith(covered):
+        return None
+    rest = item.text[len(covered):]
+    if len(rest) <= len(typed) or not rest.startswith(typed):
+        return None
+
+    col = len(line_prefix) + len(typed)
+    if end_row == row:
+        end_col += len(typed)
+    text = rest[len(typed):]
+    # inline part begins at the caret, like the text
+    text_inline, text_inline_mask = item.text_inline, item.text_inline_mask
+    if text_inline.startswith(typed):
+        text_inline = text_inline[len(typed):]
+    else:
+        text_inline = text_inline_mask = ''
+    return item._replace(
+        hint=make_hint(text, text_inline, item.text_block),
+        text=text,
+        text_inline=text_inline,
+        text_inline_mask=text_inline_mask,
+        start_position=(col, row),
+        end_position=(end_col, end_row),
+    )
+
+def _size(line_prefix, items):
+    size = len(line_prefix.encode('utf-8'))
+    for item in items:
+        size += len(item.hint.encode('utf-8')) + len(item.text.encode('utf-8')) + len(item.suffix.encode('utf-8'))
+    return size
+
+class CompletionCache:
+    '''
+    LRU cache of completion results, bounded by entry count and total size in bytes.
+    Entry key is (document, caret row, line text before the caret).
+    If user keeps typing the text which completion suggests,
+    result is served from cache with the typed part cut off.
+    Any other edit of the document drops its entries (see on_edit), and every
+    entry keeps `context`: fingerprint of the text around the caret; entry is
+    used only while it matches, so completion positions stay valid.
+    Speculative (prefetched) entries are dropped on any edit of the document.
+    '''
+
+    def __init__(self, max_entries=100, max_bytes=1024*1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # (doc, row, line_prefix) -> (items, size, speculative, context)
+        self.rows = {} # (doc, row) -> set of line_prefix
+        self.size = 0
+
+    def put(self, doc, row, line_prefix, items, speculative=False, context=None):
+        if not items:
+            return
+        key = (doc, row, line_prefix)
+        self._remove(key)
+
+        size = _size(line_prefix, items)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (items, size, speculative, context)
+        self.rows.setdefault((doc, row), set()).add(line_prefix)
+        self.size += size
+
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+
+    def get(self, doc, row, line_prefix, context=None):
+        prefixes = self.rows.get((doc, row))
+        if not prefixes:
+            return None
+
+        # longest cached prefix first: it needs the least trimming
+        for prefix in sorted(prefixes, key=len, reverse=True):
+            if not line_prefix.startswith(prefix):
+                continue
+            key = (doc, row, prefix)
+            items, __, __, entry_context = self.entries[key]
+            if entry_context != context:
+                # document around the caret was changed
+                self._remove(key)
+                continue
+            typed = line_prefix[len(prefix):]
+            if typed:
+                items = [i for i in (_trim(item, row, prefix, typed) for item in items) if i]
+            if items:
+                self.entries.move_to_end(key)
+                return items
+        return None
+
+    def on_edit(self, doc, row, line_prefix):
+        '''
+        Document was edited, caret is now at the end of line_prefix (None if unknown).
+        Entries are kept only while the user types on their row, extending their prefix.
+        '''
+        for key in [k for k in self.entries if k[0] == doc]:
+            if line_prefix is None or key[1] != row or not line_prefix.startswith(key[2]):
+                self._remove(key)
+
+    def drop_speculative(self, doc):
+        for key in [k for k, v in self.entries.items() if k[0] == doc and v[2]]:
+            self._remove(key)
+
+    def forget(self, doc):
+        for key in [k for k in self.entries if k[0] == doc]:
+            self._remove(key)
+
+    def clear(self):
+        self.entries.clear()
+        self.rows.clear()
+        self.size = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry[1]
+        doc, row, line_prefix = key
+        prefixes = self.rows.get((doc, row))
+        if prefixes is not None:
+            prefixes.discard(line_prefix)
+            if not prefixes:
+                del self.rows[(doc, row)]
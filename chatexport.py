@@ -0,0 +1,34 @@
+import io
+import subprocess
+
+BUFFER_SIZE = 64 * 1024
+
+class AnswerWriter:
+    '''
+    Writes chat answer to a file, or to stdin of a command if target is "|command".
+    Text goes through a fixed-size buffer, so memory use does not depend on answer size.
+    '''
+
+    def __init__(self, target):
+        self.target = target
+        self.process = None
+        if target.startswith('|'):
+            self.process = subprocess.Popen(target[1:], shell=True, stdin=subprocess.PIPE)
+            self.file = io.TextIOWrapper(io.BufferedWriter(self.process.stdin, BUFFER_SIZE), encoding='utf-8')
+        else:
+            self.file = open(target, 'w', encoding='utf-8', newline='', buffering=BUFFER_SIZE)
+        self.size = 0 # chars written
+
+    def write(self, text):
+        self.file.write(text)
+        self.size += len(text)
+
+    def close(self):
+        if self.file is None:
+            return
+        file, self.file = self.file, None
+        try:
+            file.close()
+        finally:
+            if self.process is not None:
+                self.process.wait()
@@ -0,0 +1,75 @@
+from .chatstream import encode_len_field
+
+REQUEST_CHAT_MESSAGES = 3 # GetChatMessageRequest.chat_messages
+SOURCE_USER = 1 # ChatMessageSource.USER
+
+class ChatHistory:
+    '''
+    Messages of one conversation which are sent with every question.
+    Each message is serialized once, as a ready chat_messages field of the request,
+    so a request is built by joining bytes. Only the most recent messages which fit
+    into max_bytes are kept, older turns are dropped.
+    '''
+
+    def __init__(self, max_bytes=100000):
+        self.max_bytes = max_bytes
+        self.items = [] # (messageId, source)
+        self.encoded = [] # serialized field of the request, for every message
+        self.ids = {} # messageId -> index
+        self.size = 0
+        self.user_count = 0
+
+    def new_id(self):
+        self.user_count += 1
+        return 'user-{}'.format(self.user_count)
+
+    def add(self, message):
+        '''
+        Returns serialized message.
+        '''
+        data = message.SerializeToString()
+        self.add_data(message.messageId, message.source, data)
+        return data
+
+    def add_data(self, message_id, source, data):
+        '''
+        Add already serialized ChatMessage.
+        '''
+        encoded = encode_len_field(REQUEST_CHAT_MESSAGES, data)
+        prefix, __, number = message_id.partition('-')
+        if prefix == 'user' and number.isdigit():
+            # history can be loaded from disk, don't repeat its ids
+            self.user_count = max(self.user_count, int(number))
+        i = self.ids.get(message_id)
+        if i is not None:
+            # the same answer is saved again (it is cumulative), keep the last one
+            self.size += len(encoded) - len(self.encoded[i])
+            self.items[i] = (message_id, source)
+            self.encoded[i] = encoded
+        else:
+            self.ids[message_id] = len(self.items)
+            self.items.append((message_id, source))
+            self.encoded.append(encoded)
+            self.size += len(encoded)
+        self.trim()
+
+    def trim(self):
+        count = len(self.items)
+        if not count:
+            return
+        start = count - 1 # the last message is kept even if it is too big
+        size = len(self.encoded[start])
+        while start > 0 and size + len(self.encoded[start-1]) <= self.max_bytes:
+            start -= 1
+            size += len(self.encoded[start])
+        # don't begin with an answer without its question
+        while start < count - 1 and self.items[start][1] != SOURCE_USER:
+            size -= len(self.encoded[start])
+            start += 1
+        if start <= 0:
+            return
+
+        del self.items[:start]
+        del self.encoded[:start]
+        self.ids = {message_id: i for i, (message_id, source) in enumerate(self.items)}
+        self.size = size
@@ -0,0 +1,79 @@
+import time
+
+from .chatstream import VARINT, encode_varint, encode_len_field
+from .frames import frame
+
+# field numbers, see proto.proto
+REQUEST_METADATA = 1
+REQUEST_PROMPT = 2
+
+METADATA_FIELDS = (
+    ('ide_name', 1),
+    ('extension_version', 2),
+    ('api_key', 3),
+    ('locale', 4),
+    ('ide_version', 7),
+    ('session_id', 10),
+    ('extension_name', 12),
+)
+
+MESSAGE_ID = 1
+MESSAGE_SOURCE = 2
+MESSAGE_TIMESTAMP = 3
+MESSAGE_CONVERSATION_ID = 4
+MESSAGE_INTENT = 5
+INTENT_GENERIC = 1
+GENERIC_TEXT = 1
+TIMESTAMP_SECONDS = 1
+TIMESTAMP_NANOS = 2
+
+SOURCE_USER = 1
+
+def encode_varint_field(field, value):
+    return encode_varint(field << 3 | VARINT) + encode_varint(value)
+
+def encode_string_field(field, value):
+    return encode_len_field(field, value.encode('utf-8'))
+
+class ChatRequestBuilder:
+    '''
+    Builds GetChatMessage requests in wire format, without protobuf objects.
+    Metadata does not change during the session, so it is serialized once;
+    only the prompt and the new message are encoded per request.
+    '''
+
+    def __init__(self, **metadata):
+        self.key = tuple(sorted(metadata.items()))
+        fields = b''.join(encode_string_field(number, metadata[name])
+                          for name, number in METADATA_FIELDS if metadata.get(name))
+        self.metadata = encode_len_field(REQUEST_METADATA, fields)
+
+    def user_message(self, conversation_id, message_id, text, time_ns=None):
+        '''
+        Returns serialized ChatMessage with the question.
+        '''
+        if time_ns is None:
+            time_ns = time.time_ns()
+        seconds, nanos = divmod(time_ns, 1000000000)
+        timestamp = encode_varint_field(TIMESTAMP_SECONDS, seconds)
+        if nanos:
+            timestamp += encode_varint_field(TIMESTAMP_NANOS, nanos)
+        intent = encode_len_field(INTENT_GENERIC, encode_string_field(GENERIC_TEXT, text))
+        return b''.join((
+            encode_string_field(MESSAGE_ID, message_id),
+            encode_varint_field(MESSAGE_SOURCE, SOURCE_USER),
+            encode_len_field(MESSAGE_TIMESTAMP, timestamp),
+            encode_string_field(MESSAGE_CONVERSATION_ID, conversation_id),
+            encode_len_field(MESSAGE_INTENT, intent),
+        ))
+
+    def request(self, prompt, chat_messages):
+        '''
+        Returns gRPC frame with GetChatMessageRequest.
+        chat_messages: already serialized chat_messages fields.
+        '''
+        parts = [self.metadata]
+        if prompt:
+            parts.append(encode_string_field(REQUEST_PROMPT, prompt))
+        parts.extend(chat_messages)
+        return frame(*parts)
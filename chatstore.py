@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import threading
+from array import array
+
+from .chatstream import read_varint, encode_varint
+
+INDEX_FILE = 'index.json'
+
+class ChatStore:
+    '''
+    Chat conversations on disk, one append-only log per conversation:
+    <id>.log - serialized ChatMessage records, each prefixed by varint length,
+    <id>.idx - offsets of the records in the log, 8 bytes each,
+    index.json - titles and modification times of all conversations.
+
+    Writes are collected on the UI thread and written in batches by a worker.
+    Reading a conversation reads only as many last records as needed.
+    '''
+
+    def __init__(self, path, dispatcher):
+        self.path = path
+        self.dispatcher = dispatcher
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock() # batches are written one by one, in order
+        self.pending = [] # (conversation_id, data, title)
+        self.writing = False
+        self.index = None # loaded lazily
+
+    def append(self, conversation_id, data, title=None):
+        '''
+        Add serialized ChatMessage to the conversation. Written in background.
+        '''
+        with self.lock:
+            self.pending.append((conversation_id, data, title))
+            if self.writing:
+                return # running writer will take it
+            self.writing = True
+        self.dispatcher.submit(self.write)
+
+    def write(self):
+        # runs in a worker thread
+        while True:
+            with self.write_lock:
+                with self.lock:
+                    batch = self.pending
+                    self.pending = []
+                    if not batch:
+                        self.writing = False
+                        return
+                self._write(batch)
+
+    def flush(self):
+        '''
+        Write pending records on the calling thread, e.g. on exit when the worker won't run anymore.
+        '''
+        with self.write_lock:
+            with self.lock:
+                batch = self.pending
+                self.pending = []
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        os.makedirs(self.path, exist_ok=True)
+
+        records = {} # conversation_id -> list of data
+        with self.lock:
+            index = self.get_index()
+            for conversation_id, data, title in batch:
+                records.setdefault(conversation_id, []).append(data)
+                info = index.setdefault(conversation_id, {'title': '', 'count': 0})
+                if title and not info['title']:
+                    info['title'] = title
+                info['count'] += 1
+                info['time'] = time.time()
+            index_data = json.dumps(index, ensure_ascii=False)
+
+        for conversation_id, items in records.items():
+            log_file, idx_file = self.files(conversation_id)
+            with open(log_file, 'ab') as log:
+                offset = log.tell()
+                offsets = array('q')
+                chunks = []
+                for data in items:
+                    offsets.append(offset)
+                    record = encode_varint(len(data)) + data
+                    chunks.append(record)
+                    offset += len(record)
+                log.write(b''.join(chunks))
+            with open(idx_file, 'ab') as idx:
+                offsets.tofile(idx)
+
+        tmp = os.path.join(self.path, INDEX_FILE + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(index_data)
+        os.replace(tmp, os.path.join(self.path, INDEX_FILE))
+
+    def files(self, conversation_id):
+        base = os.path.join(self.path, conversation_id)
+        return base + '.log', base + '.idx'
+
+    def get_index(self):
+        '''
+        Returns dict: conversation_id -> {'title', 'count', 'time'}.
+        '''
+        if self.index is None:
+            try:
+                with open(os.path.join(self.path, INDEX_FILE), encoding='utf-8') as f:
+                    self.index = json.load(f)
+            except (OSError, ValueError):
+                self.index = {}
+        return self.index
+
+    def conversations(self):
+        '''
+        Returns list of (conversation_id, title), most recent first.
+        '''
+        with self.lock:
+            items = sorted(self.get_index().items(), key=lambda i: i[1].get('time', 0), reverse=True)
+            return [(conversation_id, info.get('title', '')) for conversation_id, info in items]
+
+    def read_tail(self, conversation_id, max_bytes):
+        '''
+        Returns list of serialized ChatMessage: the last records which fit into max_bytes
+        (at least one), oldest first.
+        '''
+        log_file, idx_file = self.files(conversation_id)
+        try:
+            log_size = os.path.getsize(log_file)
+            offsets = array('q')
+            with open(idx_file, 'rb') as idx:
+                data = idx.read()
+            offsets.frombytes(data[:len(data) - len(data) % offsets.itemsize])
+        except OSError:
+            return []
+
+        # offsets are ascending, find the first record of the tail
+        start = len(offsets) - 1
+        while start > 0 and log_size - offsets[start-1] <= max_bytes:
+            start -= 1
+        if start < 0:
+            return []
+
+        with open(log_file, 'rb') as log:
+            log.seek(offsets[start])
+            data = log.read()
+
+        result = []
+        pos = 0
+        try:
+            while pos < len(data):
+                size, pos = read_varint(data, pos)
+                if pos + size > len(data):
+                    break # incomplete record, write was interrupted
+                result.append(data[pos:pos+size])
+                pos += size
+        except IndexError:
+            pass
+        return result
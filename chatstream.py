@@ -0,0 +1,263 @@
+import codecs
+import queue
+import socket
+import time
+
+import requests
+
+from .frames import FrameDecoder
+
+# wire types
+VARINT = 0
+I64 = 1
+LEN = 2
+I32 = 5
+
+# field numbers, see proto.proto
+RESPONSE_CHAT_MESSAGE = 1
+MESSAGE_CONVERSATION_ID = 4
+MESSAGE_ACTION = 6
+MESSAGE_ERROR = 7
+ACTION_TEXT = 1
+ERROR_MESSAGE = 1
+
+def read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+def encode_varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def encode_len_field(field, value):
+    return encode_varint(field << 3 | LEN) + encode_varint(len(value)) + value
+
+def iter_fields(data, pos, end):
+    '''
+    Yield (field, wire_type, key_start, start, stop) for every field in data[pos:end].
+    For LEN fields start:stop is the value, for others it is the whole encoded value.
+    '''
+    while pos < end:
+        key_start = pos
+        key, pos = read_varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == VARINT:
+            __, stop = read_varint(data, pos)
+        elif wire_type == I64:
+            stop = pos + 8
+        elif wire_type == I32:
+            stop = pos + 4
+        elif wire_type == LEN:
+            size, pos = read_varint(data, pos)
+            stop = pos + size
+        else:
+            raise ValueError('unsupported wire type {}'.format(wire_type))
+        if stop > end:
+            raise ValueError('truncated message')
+        yield field, wire_type, key_start, pos, stop
+        pos = stop
+
+def find_field(data, pos, end, number):
+    for field, wire_type, __, start, stop in iter_fields(data, pos, end):
+        if field == number and wire_type == LEN:
+            return start, stop
+    return None
+
+def answer_text(data):
+    '''
+    Returns answer from ChatMessageAction.text bytes.
+    '''
+    span = find_field(data, 0, len(data), ACTION_TEXT)
+    if span is None:
+        return ''
+    return bytes(data[span[0]:span[1]]).decode('utf-8', errors='replace')
+
+class ChatStreamAssembler:
+    '''
+    Every GetChatMessageResponse frame carries the whole answer so far.
+    Instead of parsing and decoding all of it per frame, the assembler walks
+    the wire format to find where the answer text is, and decodes only bytes
+    after the part which was already seen, with incremental UTF-8 decoder.
+    '''
+
+    def __init__(self, keep_text=True):
+        self.keep_text = keep_text # needed to build final message for history
+        self.conversation_id = None
+        self.frames = 0
+        self.size = 0 # answer bytes already decoded
+        self.reset = False # answer text was replaced, not extended
+        self.head = b'' # raw fields of ChatMessage other than answer text
+        self.data = bytearray()
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def feed(self, payload):
+        '''
+        Takes GetChatMessageResponse frame, returns new part of the answer as str,
+        or None if frame is not a conversation message.
+        '''
+        span = find_field(payload, 0, len(payload), RESPONSE_CHAT_MESSAGE)
+        if span is None:
+            return None
+
+        head = bytearray()
+        text_span = None
+        error_span = None
+        for field, wire_type, key_start, start, stop in iter_fields(payload, *span):
+            if field == MESSAGE_ACTION and wire_type == LEN:
+                text_span = find_field(payload, start, stop, ACTION_TEXT)
+                continue
+            if field == MESSAGE_ERROR and wire_type == LEN:
+                error_span = find_field(payload, start, stop, ERROR_MESSAGE)
+            elif field == MESSAGE_CONVERSATION_ID and wire_type == LEN and self.conversation_id is None:
+                self.conversation_id = bytes(payload[start:stop]).decode('utf-8', errors='replace')
+            # fields are small, keep them to build final message
+            head += payload[key_start:stop]
+
+        if not self.conversation_id:
+            return None
+        self.head = bytes(head)
+        self.frames += 1
+
+        if text_span is not None:
+            # action text is serialized message: field 1 is the answer
+            text_span = find_field(payload, *text_span, ACTION_TEXT)
+        if text_span is None:
+            text_span = error_span
+        if text_span is None:
+            return ''
+
+        start, stop = text_span
+        self.reset = stop - start < self.size
+        if self.reset:
+            self.size = 0
+            self.data.clear()
+            self.decoder.reset()
+
+        new = payload[start + self.size:stop]
+        self.size = stop - start
+        if self.keep_text:
+            self.data += new
+        return self.decoder.decode(new)
+
+    def text(self):
+        return bytes(self.data).decode('utf-8', errors='replace')
+
+    def message(self, proto_pb2, answer=None):
+        '''
+        Build ChatMessage with the answer received so far, for chat history.
+        answer: str to save instead, when the text was not kept.
+        '''
+        if not self.frames:
+            return None
+        data = bytes(self.data) if answer is None else answer.encode('utf-8')
+        text = encode_len_field(ACTION_TEXT, data)
+        action = encode_len_field(ACTION_TEXT, text)
+        return proto_pb2.ChatMessage.FromString(self.head + encode_len_field(MESSAGE_ACTION, action))
+
+class ChatStream:
+    '''
+    One chat answer, read and decoded in a worker thread.
+    Parts of the answer are put to `events` as (conversation_id, text, reset),
+    None is put when the stream is finished. UI side only takes them from the queue.
+    If `writer` is given, the answer is also written to it by the worker,
+    and the assembler does not keep the text.
+    '''
+
+    def __init__(self, client, data, headers, timeout=8, writer=None, probe=None):
+        self.client = client
+        self.probe = probe # ChatProbe
+        self.data = data
+        self.headers = headers
+        self.timeout = timeout
+        self.writer = writer
+        self.events = queue.SimpleQueue()
+        self.assembler = ChatStreamAssembler(keep_text=writer is None)
+        self.response = None
+        self.cancelled = False
+        self.error = None # message, when the stream is finished
+
+    def run(self):
+        response = None
+        errors = 0
+        probe = self.probe
+        if probe:
+            probe.sent = probe.now()
+        try:
+            response = self.client.post('GetChatMessage', self.data, self.headers, timeout=self.timeout, stream=True)
+            self.response = response
+            if self.cancelled:
+                return
+            response.raise_for_status()
+
+            frame_decoder = FrameDecoder()
+            for data in response.iter_content(chunk_size=8192):
+                if probe:
+                    if probe.first_byte is None:
+                        probe.first_byte = probe.now()
+                    probe.bytes += len(data)
+                    t = time.perf_counter()
+                # chunk can contain several frames, or only part of one
+                for message_data in frame_decoder.feed(data):
+                    try:
+                        text = self.assembler.feed(message_data)
+                    except (ValueError, IndexError) as e:
+                        print("ERROR:", e)
+                        errors += 1
+                        if errors > 2:
+                            self.error = "too many errors, aborting task."
+                            return
+                        continue
+                    if text is None: # not a conversation message, skip
+                        continue
+                    # after reset, text is the whole new answer
+                    if self.writer is not None:
+                        self.writer.write(text)
+                    self.events.put((self.assembler.conversation_id, text, self.assembler.reset))
+                if probe:
+                    probe.decode += time.perf_counter() - t
+            self.error = frame_decoder.error()
+
+        except requests.exceptions.Timeout:
+            if not self.cancelled:
+                self.error = "The request timed out."
+        except (requests.exceptions.RequestException, OSError, ValueError, AttributeError) as e:
+            # closed socket raises almost anything in the reading thread
+            if not self.cancelled:
+                self.error = str(e)
+        finally:
+            if response is not None:
+                response.close() # return connection to the pool
+            if self.writer is not None:
+                try:
+                    self.writer.close()
+                except OSError as e:
+                    self.error = self.error or str(e)
+            if probe:
+                probe.end = probe.now()
+                probe.frames = self.assembler.frames
+            self.events.put(None)
+
+    def cancel(self):
+        '''
+        Stop reading right away: shut down the socket which the worker is waiting on.
+        Can be called from any thread.
+        '''
+        self.cancelled = True
+        response = self.response
+        if response is None:
+            return
+        try:
+            response.raw._connection.sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
@@ -0,0 +1,30 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+SERVICE_PATH = '/exa.language_server_pb.LanguageServerService/'
+
+class LanguageServerClient:
+    '''
+    Long-lived HTTP client for the local language server.
+    All RPCs (completions, heartbeat, chat) go through one keep-alive pool,
+    so a burst of completions does not open a new TCP connection every time.
+    pool_size must cover all threads which send requests at the same time,
+    otherwise extra connections are opened and closed after every request.
+    '''
+
+    def __init__(self, pool_size=4):
+        self.port = None
+        self.session = requests.Session()
+        # local server never needs proxies/netrc, skip env lookups on every request
+        self.session.trust_env = False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+
+    def url(self, method, port=None):
+        return 'http://127.0.0.1:{}{}{}'.format(port or self.port, SERVICE_PATH, method)
+
+    def post(self, method, data, headers, timeout, stream=False, port=None):
+        return self.session.post(self.url(method, port), headers=headers, data=data, timeout=timeout, stream=stream)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,193 @@
+import time
+import random
+
+from cudatext import *
+
+TYPING_PAUSE = 2.0 # sec, longer gap between changes is not counted as typing
+RETRY_DELAY = 0.05 # sec, when concurrency limit is reached
+
+def ewma(avg, value, alpha=0.3):
+    return value if avg is None else avg + alpha * (value - avg)
+
+class CompletionScheduler:
+    '''
+    Keeps at most one completion request in flight per editor.
+    A newer request for the same editor supersedes the older one: if the older
+    one is still queued it is dropped, if it is already running the server is
+    asked to cancel it, and its result is ignored either way.
+    Speculative requests give way to real ones: any real request cancels them.
+    '''
+
+    def __init__(self, dispatcher, send, send_cancel):
+        self.dispatcher = dispatcher
+        self.send = send                # send(data) -> items, runs in background
+        self.send_cancel = send_cancel  # send_cancel(request_id, metadata), runs in background
+        # other CudaText instances can use the same server (share_server option),
+        # their ids should not match ours. request_id is int32 in the protocol
+        self.request_id = random.randrange(1 << 30)
+        self.active = {} # editor handle -> (request_id, future, metadata, speculative)
+        self.latency = None # average server response time, seconds
+
+    def request(self, ed_handle, data, callback, speculative=False):
+        self.cancel(ed_handle)
+        if not speculative:
+            self.cancel_speculative()
+
+        self.request_id += 1
+        request_id = self.request_id
+        metadata = data['metadata']
+        metadata['request_id'] = request_id
+        start = time.monotonic()
+
+        def on_done(items):
+            active = self.active.get(ed_handle)
+            if active is None or active[0] != request_id:
+                return # superseded
+            del self.active[ed_handle]
+            if items is not None:
+                self.latency = ewma(self.latency, time.monotonic() - start)
+            callback(items)
+
+        future = self.dispatcher.submit(self.send, data, callback=on_done)
+        self.active[ed_handle] = (request_id, future, metadata, speculative)
+
+    def cancel(self, ed_handle):
+        active = self.active.pop(ed_handle, None)
+        if active is None:
+            return
+        request_id, future, metadata, __ = active
+        if future.cancel():
+            return # was still waiting in the queue
+        self.dispatcher.submit(self.send_cancel, request_id, metadata)
+
+    def cancel_all(self):
+        for ed_handle in list(self.active):
+            self.cancel(ed_handle)
+
+    def cancel_speculative(self, ed_handle=None):
+        for h, active in list(self.active.items()):
+            if active[3] and (ed_handle is None or h == ed_handle):
+                self.cancel(h)
+
+    def in_flight(self, speculative=True):
+        if speculative:
+            return len(self.active)
+        return sum(1 for active in self.active.values() if not active[3])
+
+
+class Debouncer:
+    '''
+    Rate control for auto-completions: a request is sent only after the user
+    pauses typing. The idle threshold adapts to the typing cadence and to the
+    server latency: with a fast server it is short, since extra requests are
+    cheap; with a slow server we wait for a pause in typing.
+    on_change is called on every edit, so it only stores times; the timer
+    is restarted only when the new due time is earlier than the armed one.
+    '''
+
+    def __init__(self, scheduler, fire, delay_min=0, delay_max=500, min_interval=150, max_requests=2):
+        self.scheduler = scheduler
+        self.fire = fire # fire(ed_handle), called on the UI thread
+        self.delay_min = delay_min / 1000
+        self.delay_max = delay_max / 1000
+        self.min_interval = min_interval / 1000
+        self.max_requests = max_requests
+
+        self.typing = {}      # editor handle -> average interval between changes
+        self.last_change = {} # editor handle -> time of last change
+        self.last_sent = {}   # editor handle -> time of last request
+        self.due = {}         # editor handle -> time when request must be sent
+        self.armed = None     # time when the timer fires
+
+    def on_change(self, ed_handle):
+        now = time.monotonic()
+        prev = self.last_change.get(ed_handle)
+        self.last_change[ed_handle] = now
+        if prev is not None and now - prev < TYPING_PAUSE:
+            self.typing[ed_handle] = ewma(self.typing.get(ed_handle), now - prev)
+
+        due = max(now + self.get_delay(ed_handle),
+                  self.last_sent.get(ed_handle, 0) + self.min_interval)
+        self.due[ed_handle] = due
+        if self.armed is None or due < self.armed:
+            self.arm(now)
+
+    def get_delay(self, ed_handle):
+        typing = self.typing.get(ed_handle)
+        latency = self.scheduler.latency
+        if typing is None or latency is None:
+            return self.delay_min
+        # user is idle if no change came within ~1.5 usual intervals,
+        # but never wait longer than the server would take to answer
+        delay = min(typing * 1.5, latency)
+        return min(max(delay, self.delay_min), self.delay_max)
+
+    def arm(self, now):
+        timer_proc(TIMER_STOP, self.on_timer, 0)
+        self.armed = None
+        if self.due:
+            wait = max(0, min(self.due.values()) - now)
+            self.armed = now + wait
+            timer_proc(TIMER_START_ONE, self.on_timer, max(1, int(wait * 1000)))
+
+    def on_timer(self, *args, **kwargs):
+        now = time.monotonic()
+        for ed_handle, due in list(self.due.items()):
+            if due > now:
+                continue
+            # request for this editor would supersede its own active one,
+            # so it does not count against the limit
+            if (self.scheduler.in_flight() >= self.max_requests
+                and ed_handle not in self.scheduler.active):
+                self.due[ed_handle] = now + RETRY_DELAY
+                continue
+            del self.due[ed_handle]
+            self.last_sent[ed_handle] = now
+            self.fire(ed_handle)
+        self.arm(now)
+
+    def forget(self, ed_handle):
+        for d in (self.typing, self.last_change, self.last_sent, self.due):
+            d.pop(ed_handle, None)
+
+
+class Prefetcher:
+    '''
+    Sends speculative completion request when the caret was moved to another
+    line and rested there for some time, so the result is already in the cache when completion is invoked.
+    It has the lowest priority: nothing is sent while real requests are in flight
+    or when the concurrency budget is used up.
+    '''
+
+    def __init__(self, scheduler, fire, delay=0, max_requests=2):
+        self.scheduler = scheduler
+        self.fire = fire # fire(ed_handle, caret), called on the UI thread
+        self.delay = delay # ms, 0 - disabled
+        self.max_requests = max_requests
+        self.target = None
+        self.line = None # (editor handle, row) of last caret position
+
+    def on_caret(self, ed_handle, caret):
+        if self.delay <= 0:
+            return
+        line = (ed_handle, caret[1])
+        moved, self.line = line != self.line, line
+        # typing in the same line is handled by usual requests
+        if not moved and self.target is None:
+            return
+        self.target = (ed_handle, caret)
+        timer_proc(TIMER_STOP, self.on_timer, 0)
+        timer_proc(TIMER_START_ONE, self.on_timer, self.delay)
+
+    def on_timer(self, *args, **kwargs):
+        target, self.target = self.target, None
+        if target is None:
+            return
+        if (self.scheduler.in_flight(speculative=False) > 0
+            or self.scheduler.in_flight() >= self.max_requests):
+            return
+        self.fire(*target)
+
+    def cancel(self):
+        self.target = None
+        timer_proc(TIMER_STOP, self.on_timer, 0)
@@ -0,0 +1,83 @@
+import pathlib
+
+from cudatext import *
+
+from .docsync import DocumentSync
+from .util import language_enum, lex_ids, is_editor_valid
+
+class ContextProvider:
+    '''
+    Collects snippets of other open documents for completion request
+    ("other_documents"): editors with the same lexer, most recently used first.
+    Snapshots are cached per editor and re-read only when the document changed.
+    '''
+
+    def __init__(self, max_docs=5, max_bytes=200000):
+        self.max_docs = max_docs   # 0 - disabled
+        self.max_bytes = max_bytes # for all documents together
+        self.sync = DocumentSync(lines=0, max_bytes=max_bytes // max(1, max_docs))
+        self.mru = [] # editor handles, most recently used first
+        self.docs = {} # editor handle -> (text, first_row, document)
+
+    def on_focus(self, ed_handle):
+        if ed_handle in self.mru:
+            self.mru.remove(ed_handle)
+        self.mru.insert(0, ed_handle)
+
+    def get_documents(self, ed_handle, lexer):
+        if self.max_docs <= 0:
+            return []
+
+        # tabs which were never focused go after recently used ones
+        handles = self.mru + [h for h in ed_handles() if h not in self.mru]
+
+        documents = []
+        total = 0
+        for h in handles:
+            if h == ed_handle:
+                continue
+            editor = Editor(h)
+            if not is_editor_valid(editor):
+                self.forget(h)
+                continue
+            if (editor.get_prop(PROP_LEXER_FILE) != lexer
+                or editor.get_prop(PROP_TAG, 'codeium:') == 'chat'
+                or not editor.get_filename()):
+                continue
+
+            document = self.get_document(editor)
+            size = len(document['text'])
+            if total + size > self.max_bytes:
+                continue
+            documents.append(document)
+            total += size
+            if len(documents) >= self.max_docs:
+                break
+        return documents
+
+    def get_document(self, editor):
+        h = editor.get_prop(PROP_HANDLE_SELF)
+        row = editor.get_carets()[0][1]
+        text, first_row = self.sync.get_text(editor, row)
+
+        doc = self.docs.get(h)
+        if doc is not None and doc[0] is text and doc[1] == first_row:
+            return doc[2] # snapshot was not re-read
+
+        lexer = editor.get_prop(PROP_LEXER_FILE)
+        uri = pathlib.Path(editor.get_filename()).as_uri()
+        document = {
+            'text': text,
+            'editor_language': lexer or 'plaintext',
+            'language': language_enum.get(lex_ids.get(lexer, 'plaintext'), 30),
+            'absolute_path': uri,
+            'absolute_uri': uri,
+        }
+        self.docs[h] = (text, first_row, document)
+        return document
+
+    def forget(self, ed_handle):
+        if ed_handle in self.mru:
+            self.mru.remove(ed_handle)
+        self.docs.pop(ed_handle, None)
+        self.sync.forget(ed_handle)
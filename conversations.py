@@ -0,0 +1,122 @@
+import uuid
+from collections import deque
+
+from .chathistory import ChatHistory
+
+class Conversation:
+    def __init__(self, conversation_id, history_bytes=100000):
+        self.id = conversation_id
+        self.history = ChatHistory(history_bytes) # messages which are sent with every question
+        self.ed_handle = None # chat tab, created with the first answer
+        self.stream = None # ChatStream, while the answer is waited for or received
+        self.answering = False # stays True for a while after the stream is finished
+        self.go_to_end = True # chat tab follows the answer
+        self.closed = False # tab was closed, removed when the stream is finished
+
+class ConversationManager:
+    '''
+    Chat conversations, each with own history, tab and answer stream.
+    Several answers are received at the same time, but not more than max_streams:
+    the others wait in the queue until some stream is finished.
+    '''
+
+    def __init__(self, run, max_streams=2, history_bytes=100000):
+        self.run = run # run(stream) starts reading the stream in background
+        self.max_streams = max(1, max_streams)
+        self.history_bytes = history_bytes
+        self.conversations = {} # conversation id -> Conversation
+        self.running = [] # conversations which streams are read now
+        self.pending = deque() # conversations which streams wait for their turn
+        self.last = None # conversation of the last question
+
+    def new(self):
+        conversation = Conversation(uuid.uuid4().hex, self.history_bytes)
+        self.conversations[conversation.id] = conversation
+        return conversation
+
+    def restore(self, conversation_id):
+        '''
+        Conversation loaded from disk. If it is still known (e.g. its tab is not
+        opened yet, while the answer is pending or streamed), the same object is returned.
+        '''
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None:
+            conversation = Conversation(conversation_id, self.history_bytes)
+            self.conversations[conversation_id] = conversation
+        self.last = conversation
+        return conversation
+
+    def by_editor(self, ed_handle):
+        for conversation in self.conversations.values():
+            if conversation.ed_handle == ed_handle:
+                return conversation
+        return None
+
+    def for_question(self, ed_handle):
+        '''
+        Question asked in a chat tab continues its conversation. Otherwise the last
+        conversation is continued if it is idle, or else new one is started.
+        '''
+        conversation = self.by_editor(ed_handle)
+        if conversation is None:
+            last = self.last
+            if last is not None and not last.closed and last.stream is None:
+                conversation = last
+            else:
+                conversation = self.new()
+        self.last = conversation
+        return conversation
+
+    def start(self, conversation, stream):
+        conversation.stream = stream
+        conversation.answering = True
+        if len(self.running) < self.max_streams:
+            self.running.append(conversation)
+            self.run(stream)
+        else:
+            self.pending.append(conversation)
+
+    def streams(self):
+        '''
+        Conversations with running, pending or just canceled stream.
+        '''
+        return [c for c in self.conversations.values() if c.stream is not None]
+
+    def cancel(self, conversation):
+        stream = conversation.stream
+        if stream is None or stream.cancelled:
+            return
+        stream.cancel()
+        if conversation in self.pending:
+            # it was never started, finish it the same way as the worker would
+            self.pending.remove(conversation)
+            stream.events.put(None)
+
+    def finish(self, conversation):
+        conversation.stream = None
+        if conversation.closed or (conversation.ed_handle is None and conversation is not self.last):
+            # tab was closed, or never opened because there was no answer
+            self.conversations.pop(conversation.id, None)
+        if conversation in self.running:
+            self.running.remove(conversation)
+        while self.pending and len(self.running) < self.max_streams:
+            next_conversation = self.pending.popleft()
+            self.running.append(next_conversation)
+            self.run(next_conversation.stream)
+
+    def forget(self, ed_handle):
+        conversation = self.by_editor(ed_handle)
+        if conversation is None:
+            return None
+        conversation.closed = True
+        conversation.ed_handle = None
+        self.cancel(conversation)
+        if conversation.stream is None:
+            del self.conversations[conversation.id]
+        return conversation
+
+    def answering(self, ed_handle=None):
+        if ed_handle is None:
+            return any(c.answering for c in self.conversations.values())
+        conversation = self.by_editor(ed_handle)
+        return conversation is not None and conversation.answering
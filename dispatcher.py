@@ -0,0 +1,59 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from cudatext import *
+
+class Dispatcher:
+    '''
+    Process-wide background worker pool.
+    Jobs run in worker threads, their callbacks are delivered on the UI thread
+    by a timer which is active only while some job is in flight.
+    '''
+
+    def __init__(self, max_workers=4, interval=20):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='codeium')
+        self.results = queue.SimpleQueue()
+        self.pending = 0
+        self.interval = interval
+        self.timer_active = False
+
+    def submit(self, fn, *args, callback=None):
+        '''
+        Run fn(*args) in background. callback(result) is called on the UI thread,
+        with None as result if fn raised an exception. Must be called from the UI thread.
+        '''
+        future = self.executor.submit(fn, *args)
+        self.pending += 1
+        future.add_done_callback(lambda f: self.results.put((f, callback)))
+        if not self.timer_active:
+            self.timer_active = True
+            timer_proc(TIMER_START, self.on_timer, self.interval)
+        return future
+
+    def on_timer(self, *args, **kwargs):
+        while True:
+            try:
+                future, callback = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            if future.cancelled():
+                continue
+
+            result = None
+            exc = future.exception()
+            if exc is not None:
+                print("ERROR: {}: {}".format(type(exc).__name__, exc))
+            else:
+                result = future.result()
+            if callback:
+                callback(result)
+
+        if self.pending <= 0:
+            self.pending = 0
+            self.timer_active = False
+            timer_proc(TIMER_STOP, self.on_timer, 0)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,133 @@
+from cudatext import *
+
+from .lineindex import LineIndex
+
+class DocumentSync:
+    '''
+    Tracks per-editor snapshot of the text which is sent to the server.
+    Language server API has no incremental document updates, so instead of
+    the whole buffer we send a bounded window of lines around the caret.
+    Snapshot is re-read from the editor only when the document version
+    changed or the window moved.
+
+    Per-editor LineIndex is kept up to date from caret events: rows between
+    caret position before and after an edit are re-read, so the byte-bounded
+    window is found without scanning the buffer.
+    '''
+
+    def __init__(self, lines=1000, max_bytes=500000):
+        self.lines = lines          # lines before and after the caret, 0 - whole document
+        self.max_bytes = max_bytes  # 0 - no limit
+        self.docs = {} # editor handle -> (version, first, last, row, text, text_first)
+        self.indexes = {} # editor handle -> [index, version, dirty_from, dirty_to]
+        self.carets = {} # editor handle -> last known caret row
+
+    def get_text(self, editor, row):
+        '''
+        Returns (text, first_row): text of the window around the given row
+        and index of the window's first line in the document.
+        '''
+        h = editor.get_prop(PROP_HANDLE_SELF)
+        version = editor.get_prop(PROP_MODIFIED_VERSION)
+        count = editor.get_line_count()
+        if self.lines > 0:
+            first = max(0, row - self.lines)
+            last = min(count - 1, row + self.lines)
+        else:
+            first, last = 0, count - 1
+
+        if self.max_bytes > 0:
+            index = self.get_index(editor)
+            half = self.max_bytes // 2
+            caret = index.offset(0, row)
+            first = max(first, index.position(max(0, caret - half))[1])
+            last = min(last, index.position(min(index.size(), caret + half))[1])
+
+        doc = self.docs.get(h)
+        if (doc is not None and doc[:3] == (version, first, last)
+            and (doc[3] is None or doc[3] == row)):
+            return doc[4], doc[5]
+
+        if first == 0 and last == count - 1:
+            text = editor.get_text_all()
+        elif last < count - 1:
+            text = editor.get_text_substr(0, first, 0, last + 1)
+            if text.endswith('\n'):
+                text = text[:-1]
+        else:
+            text = editor.get_text_substr(0, first, editor.get_line_len(last), last)
+
+        size = len(text)
+        text, text_first = self.fit(text, first, row)
+        # trimmed window depends on caret row
+        trimmed_row = row if len(text) != size else None
+        self.docs[h] = (version, first, last, trimmed_row, text, text_first)
+        return text, text_first
+
+    def fit(self, text, first, row):
+        '''
+        Drop lines farthest from the caret until text fits into max_bytes.
+        '''
+        if self.max_bytes <= 0 or len(text) * 4 <= self.max_bytes:
+            return text, first # fits even if every char takes 4 bytes
+
+        lines = text.split('\n')
+        sizes = [len(line.encode('utf-8')) + 1 for line in lines]
+        total = sum(sizes)
+        lo, hi = 0, len(lines) - 1
+        caret = row - first
+        while total > self.max_bytes and lo < hi:
+            if caret - lo >= hi - caret:
+                total -= sizes[lo]
+                lo += 1
+            else:
+                total -= sizes[hi]
+                hi -= 1
+        return '\n'.join(lines[lo:hi + 1]), first + lo
+
+    def on_caret(self, editor):
+        '''
+        Remember rows touched by edits, call it on every caret move.
+        '''
+        h = editor.get_prop(PROP_HANDLE_SELF)
+        row = editor.get_carets()[0][1]
+        prev = self.carets.get(h, row)
+        self.carets[h] = row
+
+        entry = self.indexes.get(h)
+        if entry is None or entry[1] == editor.get_prop(PROP_MODIFIED_VERSION):
+            return
+        # edit happened between previous and current caret position
+        lo, hi = min(prev, row), max(prev, row)
+        if entry[2] is not None:
+            lo, hi = min(lo, entry[2]), max(hi, entry[3])
+        entry[2], entry[3] = lo, hi
+
+    def get_index(self, editor):
+        h = editor.get_prop(PROP_HANDLE_SELF)
+        version = editor.get_prop(PROP_MODIFIED_VERSION)
+        entry = self.indexes.get(h)
+        if entry is not None and entry[1] == version:
+            return entry[0]
+
+        count = editor.get_line_count()
+        if entry is not None and entry[2] is not None:
+            index, __, lo, hi = entry
+            hi = min(hi, count - 1)
+            old_hi = hi - (count - index.line_count())
+            if lo <= old_hi + 1 and old_hi < index.line_count():
+                index.replace(lo, old_hi - lo + 1, [editor.get_line_len(r) for r in range(lo, hi + 1)])
+                # cheap check that edits were near the caret indeed
+                row = self.carets.get(h, 0)
+                if row < count and index.lengths[row] == editor.get_line_len(row):
+                    self.indexes[h] = [index, version, None, None]
+                    return index
+
+        index = LineIndex.from_text(editor.get_text_all())
+        self.indexes[h] = [index, version, None, None]
+        return index
+
+    def forget(self, ed_handle):
+        self.docs.pop(ed_handle, None)
+        self.indexes.pop(ed_handle, None)
+        self.carets.pop(ed_handle, None)
@@ -0,0 +1,110 @@
+import os
+import zlib
+import hashlib
+
+import requests
+
+CHUNK_SIZE = 64 * 1024
+
+class DownloadError(Exception): pass
+class ChecksumError(DownloadError): pass # received data is broken, can't be resumed
+class DownloadCancelled(DownloadError): pass # stop() returned True, part file is kept
+
+def download_gz(url, out_file, progress=None, sha256=None, session=None, timeout=30, stop=None):
+    '''
+    Download gzip-compressed file and decompress it to out_file on the fly.
+
+    Compressed data is also kept in out_file + '.gz.part', so an interrupted
+    download continues with HTTP Range request next time. Output is written to
+    a temp file which replaces out_file only after gzip CRC (and sha256 of the
+    decompressed data, if given) is verified.
+
+    progress(done, total): called from the downloading thread, total is 0 if unknown.
+    stop(): checked after every chunk, download is aborted when it returns True.
+    Doesn't use cudatext API, can run in any thread.
+    '''
+    part_file = out_file + '.gz.part'
+    tmp_file = out_file + '.tmp'
+    session = session or requests
+    offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+
+    headers = {'Range': 'bytes={}-'.format(offset)} if offset else {}
+    response = None
+    try:
+        response = session.get(url, headers=headers, stream=True, timeout=timeout)
+        if response.status_code == 416:
+            # nothing left to receive, part is complete
+            response.close()
+            response = None
+        elif response.status_code == 206:
+            pass
+        elif response.status_code == 200:
+            offset = 0 # server ignored the Range
+        else:
+            raise DownloadError('{} - {}'.format(response.status_code, response.reason))
+
+        total = 0
+        if response is not None:
+            total = int(response.headers.get('Content-Length', 0) or 0)
+            if total:
+                total += offset
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) # gzip: checks CRC and size at the end
+        digest = hashlib.sha256()
+
+        def write(data, out):
+            try:
+                data = decompressor.decompress(data)
+            except zlib.error as e:
+                raise ChecksumError('broken archive: {}'.format(e))
+            digest.update(data)
+            out.write(data)
+
+        with open(tmp_file, 'wb') as out:
+            # already received part is decompressed again, it is local and fast
+            done = 0
+            if offset:
+                with open(part_file, 'rb') as part:
+                    for data in iter(lambda: part.read(CHUNK_SIZE), b''):
+                        write(data, out)
+                        done += len(data)
+
+            if response is not None:
+                with open(part_file, 'ab' if offset else 'wb') as part:
+                    for data in response.iter_content(CHUNK_SIZE):
+                        if stop and stop():
+                            raise DownloadCancelled('download is cancelled')
+                        part.write(data)
+                        write(data, out)
+                        done += len(data)
+                        if progress:
+                            progress(done, total)
+
+            out.write(decompressor.flush())
+            if not decompressor.eof:
+                if response is None:
+                    raise ChecksumError('archive is incomplete')
+                raise DownloadError('download is incomplete')
+    except requests.exceptions.RequestException as e:
+        # part file is kept for resume
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise DownloadError(str(e))
+    except DownloadError as e:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        if isinstance(e, ChecksumError) and os.path.exists(part_file):
+            os.remove(part_file)
+        raise
+    finally:
+        if response is not None:
+            response.close()
+
+    if sha256 and digest.hexdigest().lower() != sha256.lower():
+        os.remove(tmp_file)
+        os.remove(part_file)
+        raise ChecksumError('checksum mismatch')
+
+    os.replace(tmp_file, out_file)
+    os.remove(part_file)
+    return out_file
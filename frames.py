@@ -0,0 +1,110 @@
+import json
+import zlib
+
+FLAG_COMPRESSED = 0x01
+FLAG_END_STREAM = 0x02 # Connect protocol: last frame, JSON with optional error
+FLAG_TRAILERS   = 0x80 # gRPC-Web: last frame, trailers as HTTP header lines
+
+HEADER_SIZE = 5
+COMPACT_SIZE = 64 * 1024
+
+def frame(*parts):
+    '''
+    Wrap serialized message into uncompressed gRPC frame.
+    Message can be given in parts, they are copied only once, into the frame.
+    '''
+    size = sum(len(part) for part in parts)
+    # flags byte is 0: not compressed
+    return b''.join((b'\x00', size.to_bytes(4, 'big'), *parts))
+
+def parse_trailers(data):
+    trailers = {}
+    for line in bytes(data).decode('utf-8', errors='replace').split('\r\n'):
+        key, sep, value = line.partition(':')
+        if sep:
+            trailers[key.strip().lower()] = value.strip()
+    return trailers
+
+def parse_end_stream(data):
+    trailers = {}
+    try:
+        error = json.loads(bytes(data) or b'{}').get('error')
+    except ValueError:
+        return trailers
+    if error:
+        trailers['grpc-status'] = str(error.get('code', 'unknown'))
+        trailers['grpc-message'] = error.get('message', '')
+    else:
+        trailers['grpc-status'] = '0'
+    return trailers
+
+class FrameDecoder:
+    '''
+    Streaming decoder of length-prefixed gRPC frames:
+    1 byte of flags, 4 bytes of big-endian payload size, payload.
+
+    Chunks are appended to one buffer which is read by offset. The consumed
+    part is cut off only when it becomes big, so the unread rest is not copied
+    for every frame. Every complete frame in the buffer is returned.
+    '''
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.pos = 0
+        self.trailers = None # dict, when the final frame was received
+
+    def feed(self, data):
+        '''
+        Add chunk of the stream, yield payloads of all complete frames as memoryview.
+        Payload is valid only until the next item is requested.
+        '''
+        if self.pos >= COMPACT_SIZE and self.pos * 2 >= len(self.buffer):
+            del self.buffer[:self.pos]
+            self.pos = 0
+        self.buffer += data
+
+        buffer = self.buffer
+        view = memoryview(buffer)
+        payload = None
+        try:
+            while len(buffer) - self.pos >= HEADER_SIZE:
+                flags = buffer[self.pos]
+                start = self.pos + HEADER_SIZE
+                end = start + int.from_bytes(view[self.pos+1:start], 'big')
+                if end > len(buffer):
+                    break
+                self.pos = end
+
+                payload = view[start:end]
+                if flags & FLAG_COMPRESSED:
+                    # gzip or deflate, as announced in grpc-encoding
+                    payload = memoryview(zlib.decompress(payload, wbits=32+zlib.MAX_WBITS))
+
+                if flags & FLAG_TRAILERS:
+                    self.trailers = parse_trailers(payload)
+                elif flags & FLAG_END_STREAM:
+                    self.trailers = parse_end_stream(payload)
+                else:
+                    yield payload
+                payload.release()
+        finally:
+            if payload is not None:
+                payload.release()
+            view.release()
+
+    def pending(self):
+        '''
+        Number of received bytes which do not form a complete frame yet.
+        '''
+        return len(self.buffer) - self.pos
+
+    def error(self):
+        '''
+        Returns error message from trailers, or None if stream ended fine (or not yet).
+        '''
+        if not self.trailers:
+            return None
+        status = self.trailers.get('grpc-status', '0')
+        if status == '0':
+            return None
+        return '{} (status {})'.format(self.trailers.get('grpc-message', ''), status)
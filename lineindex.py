@@ -0,0 +1,51 @@
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+class LineIndex:
+    '''
+    Line lengths of a text with lazily computed line start offsets.
+    Converts between (col, row) positions and char offsets without asking
+    the editor, and can be updated incrementally by replacing a range of lines.
+    '''
+
+    def __init__(self, lengths=(0,)):
+        self.lengths = array('q', lengths)
+        self.starts = array('q')
+        self.valid = 0 # number of correct items in self.starts
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(len(line) for line in text.split('\n'))
+
+    def line_count(self):
+        return len(self.lengths)
+
+    def replace(self, row, old_count, new_lengths):
+        self.lengths[row:row+old_count] = array('q', new_lengths)
+        self.valid = min(self.valid, row)
+
+    def _update(self):
+        if self.valid == len(self.lengths) and len(self.starts) == self.valid:
+            return
+        start = self.valid
+        offset = 0 if start == 0 else self.starts[start-1] + self.lengths[start-1] + 1
+        tail = accumulate((n + 1 for n in self.lengths[start:-1]), initial=offset)
+        self.starts[start:] = array('q', tail)
+        self.valid = len(self.lengths)
+
+    def size(self):
+        self._update()
+        return self.starts[-1] + self.lengths[-1]
+
+    def offset(self, col, row):
+        self._update()
+        return self.starts[row] + col
+
+    def position(self, offset):
+        '''
+        Returns (col, row) for char offset.
+        '''
+        self._update()
+        row = bisect_right(self.starts, offset) - 1
+        return offset - self.starts[row], row
@@ -0,0 +1,127 @@
+import os
+import re
+import sys
+import time
+import select
+import threading
+
+PORT_FILE_RE = re.compile(r'^\d+$')
+PORT_LINE_RE = re.compile(rb'listening on .*?port (?:at )?(\d+)', re.IGNORECASE)
+
+POLL_MIN = 0.01
+POLL_MAX = 0.5
+
+def scan_port_dir(path):
+    '''
+    Server creates file named by its port in manager_dir. Returns the port or None.
+    '''
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if PORT_FILE_RE.match(entry.name):
+                    return int(entry.name)
+    except OSError:
+        pass
+    return None
+
+class Inotify:
+    '''
+    Minimal inotify binding (Linux), tells when files are created in a folder.
+    '''
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self, path):
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = self.IN_CREATE | self.IN_MOVED_TO | self.IN_CLOSE_WRITE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed')
+
+    def wait(self, timeout):
+        '''
+        Returns True if something happened in the folder during timeout.
+        '''
+        ready, __, __ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+class PortWatcher:
+    '''
+    Finds the port of just started language server, whichever comes first:
+    port file in manager_dir (inotify on Linux, polling with growing interval
+    elsewhere), or "listening on ... port N" line in the server output.
+    '''
+
+    def __init__(self, manager_dir):
+        self.manager_dir = manager_dir
+        self.port = None
+        self.found = threading.Event()
+
+    def read_output(self, stream):
+        '''
+        Reads server stdout/stderr until it is closed, so the pipe never gets full.
+        Runs in its own thread.
+        '''
+        with stream:
+            for line in iter(stream.readline, b''):
+                if self.port is None:
+                    match = PORT_LINE_RE.search(line)
+                    if match:
+                        self.set_port(int(match.group(1)))
+
+    def set_port(self, port):
+        if self.port is None:
+            self.port = port
+        self.found.set()
+
+    def wait(self, timeout, stop=lambda: False):
+        '''
+        Blocks until the port is found, returns it, or None after timeout or when stop() is True.
+        '''
+        deadline = time.monotonic() + timeout
+        inotify = None
+        if sys.platform.startswith('linux'):
+            try:
+                inotify = Inotify(self.manager_dir)
+            except (OSError, AttributeError):
+                inotify = None
+        try:
+            delay = POLL_MIN
+            while True:
+                # watch is added before the scan, so the file can't be missed
+                port = scan_port_dir(self.manager_dir)
+                if port is not None:
+                    self.set_port(port)
+                if self.port is not None:
+                    return self.port
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or stop():
+                    return None
+                if inotify is not None:
+                    # short timeout: output line or stop() should not wait long
+                    inotify.wait(min(remaining, 0.05))
+                else:
+                    self.found.wait(min(remaining, delay))
+                    delay = min(delay * 2, POLL_MAX)
+        finally:
+            if inotify is not None:
+                inotify.close()
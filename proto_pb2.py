@@ -25,17 +25,19 @@ _sym_db = _symbol_database.Default()
 from google.protobuf import timestamp_pb2 as google_dot_protobuf_dot_timestamp__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bproto.proto\x1a\x1fgoogle/protobuf/timestamp.proto\"\x9f\x02\n\x08Metadata\x12\x10\n\x08ide_name\x18\x01 \x01(\t\x12\x13\n\x0bide_version\x18\x07 \x01(\t\x12\x16\n\x0e\x65xtension_name\x18\x0c \x01(\t\x12\x19\n\x11\x65xtension_version\x18\x02 \x01(\t\x12\x0f\n\x07\x61pi_key\x18\x03 \x01(\t\x12\x0e\n\x06locale\x18\x04 \x01(\t\x12\n\n\x02os\x18\x05 \x01(\t\x12\x10\n\x08hardware\x18\x08 \x01(\t\x12\x19\n\x11\x64isable_telemetry\x18\x06 \x01(\x08\x12\x12\n\nsession_id\x18\n \x01(\t\x12\x12\n\nrequest_id\x18\t \x01(\x05\x12\x16\n\x0esource_address\x18\x0b \x01(\t\x12\x12\n\nuser_agent\x18\r \x01(\t\x12\x0b\n\x03url\x18\x0e \x01(\t\"\x86\x02\n\x0b\x43hatMessage\x12\x11\n\tmessageId\x18\x01 \x01(\t\x12\"\n\x06source\x18\x02 \x01(\x0e\x32\x12.ChatMessageSource\x12-\n\ttimestamp\x18\x03 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x16\n\x0e\x63onversationId\x18\x04 \x01(\t\x12$\n\x06intent\x18\x05 \x01(\x0b\x32\x12.ChatMessageIntentH\x00\x12$\n\x06\x61\x63tion\x18\x06 \x01(\x0b\x32\x12.ChatMessageActionH\x00\x12\"\n\x05\x65rror\x18\x07 \x01(\x0b\x32\x11.ChatMessageErrorH\x00\x42\t\n\x07\x63ontent\"#\n\x10\x43hatMessageError\x12\x0f\n\x07message\x18\x01 \x01(\t\"\xcb\x02\n\x11\x43hatMessageIntent\x12!\n\x07generic\x18\x01 \x01(\x0b\x32\x0e.GenericIntentH\x00\x12\x31\n\x0f\x65xplainFunction\x18\x02 \x01(\x0b\x32\x16.ExplainFunctionIntentH\x00\x12\x35\n\x11\x66unctionDocstring\x18\x03 \x01(\x0b\x32\x18.FunctionDocstringIntentH\x00\x12\x33\n\x10\x66unctionRefactor\x18\x04 \x01(\x0b\x32\x17.FunctionRefactorIntentH\x00\x12\x33\n\x10\x65xplainCodeBlock\x18\x05 \x01(\x0b\x32\x17.ExplainCodeBlockIntentH\x00\x12\x35\n\x11\x63odeBlockRefactor\x18\x06 \x01(\x0b\x32\x18.CodeBlockRefactorIntentH\x00\x42\x08\n\x06intent\"\x1d\n\rGenericIntent\x12\x0c\n\x04text\x18\x01 \x01(\t\"\x17\n\x15\x45xplainFunctionIntent\"\x19\n\x17\x46unctionDocstringIntent\"\x18\n\x16\x46unctionRefactorIntent\"\x18\n\x16\x45xplainCodeBlockIntent\"\x19\n\x17\x43odeBlockRefactorIntent\"C\n\x11\x43hatMessageAction\x12\x0e\n\x04text\x18\x01 \x01(\x0cH\x00\x12\x14\n\nnum_tokens\x18\x02 \x01(\x03H\x00\x42\x08\n\x06\x61\x63tion\"\x17\n\x07Generic\x12\x0c\n\x04text\x18\x01 \x01(\t\"\x97\x01\n\x15GetChatMessageRequest\x12\x1b\n\x08metadata\x18\x01 \x01(\x0b\x32\t.Metadata\x12\x0e\n\x06prompt\x18\x02 \x01(\t\x12#\n\rchat_messages\x18\x03 \x03(\x0b\x32\x0c.ChatMessage\x12,\n\x11\x65xperiment_config\x18\x04 \x01(\x0b\x32\x11.ExperimentConfig\"w\n\x10\x45xperimentConfig\x12\x30\n\x18\x66orce_enable_experiments\x18\x01 \x03(\x0e\x32\x0e.ExperimentKey\x12\x31\n\x19\x66orce_disable_experiments\x18\x02 \x03(\x0e\x32\x0e.ExperimentKey\"\xa2\x01\n\x1dRecordChatPanelSessionRequest\x12\x1b\n\x08metadata\x18\x01 \x01(\x0b\x32\t.Metadata\x12\x32\n\x0estartTimestamp\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x30\n\x0c\x65ndTimestamp\x18\x03 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\" \n\x1eRecordChatPanelSessionResponse\"<\n\x16GetChatMessageResponse\x12\"\n\x0c\x63hat_message\x18\x01 \x01(\x0b\x32\x0c.ChatMessage*G\n\x11\x43hatMessageSource\x12\x0f\n\x0bUNSPECIFIED\x10\x00\x12\x08\n\x04USER\x10\x01\x12\n\n\x06SYSTEM\x10\x02\x12\x0b\n\x07UNKNOWN\x10\x03*W\n\rExperimentKey\x12\x1a\n\x16\x45XPERIMENT_KEY_UNKNOWN\x10\x00\x12\x14\n\x10\x45XPERIMENT_KEY_1\x10\x01\x12\x14\n\x10\x45XPERIMENT_KEY_2\x10\x02\x32\xb9\x01\n\x15LanguageServerService\x12\x43\n\x0eGetChatMessage\x12\x16.GetChatMessageRequest\x1a\x17.GetChatMessageResponse\"\x00\x12[\n\x16RecordChatPanelSession\x12\x1e.RecordChatPanelSessionRequest\x1a\x1f.RecordChatPanelSessionResponse\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bproto.proto\x1a\x1fgoogle/protobuf/timestamp.proto\"\x9f\x02\n\x08Metadata\x12\x10\n\x08ide_name\x18\x01 \x01(\t\x12\x13\n\x0bide_version\x18\x07 \x01(\t\x12\x16\n\x0e\x65xtension_name\x18\x0c \x01(\t\x12\x19\n\x11\x65xtension_version\x18\x02 \x01(\t\x12\x0f\n\x07\x61pi_key\x18\x03 \x01(\t\x12\x0e\n\x06locale\x18\x04 \x01(\t\x12\n\n\x02os\x18\x05 \x01(\t\x12\x10\n\x08hardware\x18\x08 \x01(\t\x12\x19\n\x11\x64isable_telemetry\x18\x06 \x01(\x08\x12\x12\n\nsession_id\x18\n \x01(\t\x12\x12\n\nrequest_id\x18\t \x01(\x05\x12\x16\n\x0esource_address\x18\x0b \x01(\t\x12\x12\n\nuser_agent\x18\r \x01(\t\x12\x0b\n\x03url\x18\x0e \x01(\t\"\x86\x02\n\x0b\x43hatMessage\x12\x11\n\tmessageId\x18\x01 \x01(\t\x12\"\n\x06source\x18\x02 \x01(\x0e\x32\x12.ChatMessageSource\x12-\n\ttimestamp\x18\x03 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x16\n\x0e\x63onversationId\x18\x04 \x01(\t\x12$\n\x06intent\x18\x05 \x01(\x0b\x32\x12.ChatMessageIntentH\x00\x12$\n\x06\x61\x63tion\x18\x06 \x01(\x0b\x32\x12.ChatMessageActionH\x00\x12\"\n\x05\x65rror\x18\x07 \x01(\x0b\x32\x11.ChatMessageErrorH\x00\x42\t\n\x07\x63ontent\"#\n\x10\x43hatMessageError\x12\x0f\n\x07message\x18\x01 \x01(\t\"\xcb\x02\n\x11\x43hatMessageIntent\x12!\n\x07generic\x18\x01 \x01(\x0b\x32\x0e.GenericIntentH\x00\x12\x31\n\x0f\x65xplainFunction\x18\x02 \x01(\x0b\x32\x16.ExplainFunctionIntentH\x00\x12\x35\n\x11\x66unctionDocstring\x18\x03 \x01(\x0b\x32\x18.FunctionDocstringIntentH\x00\x12\x33\n\x10\x66unctionRefactor\x18\x04 \x01(\x0b\x32\x17.FunctionRefactorIntentH\x00\x12\x33\n\x10\x65xplainCodeBlock\x18\x05 \x01(\x0b\x32\x17.ExplainCodeBlockIntentH\x00\x12\x35\n\x11\x63odeBlockRefactor\x18\x06 \x01(\x0b\x32\x18.CodeBlockRefactorIntentH\x00\x42\x08\n\x06intent\"\x1d\n\rGenericIntent\x12\x0c\n\x04text\x18\x01 \x01(\t\"\x17\n\x15\x45xplainFunctionIntent\"\x19\n\x17\x46unctionDocstringIntent\"\x18\n\x16\x46unctionRefactorIntent\"\x18\n\x16\x45xplainCodeBlockIntent\"\x19\n\x17\x43odeBlockRefactorIntent\"C\n\x11\x43hatMessageAction\x12\x0e\n\x04text\x18\x01 \x01(\x0cH\x00\x12\x14\n\nnum_tokens\x18\x02 \x01(\x03H\x00\x42\x08\n\x06\x61\x63tion\"\x17\n\x07Generic\x12\x0c\n\x04text\x18\x01 \x01(\t\"\x97\x01\n\x15GetChatMessageRequest\x12\x1b\n\x08metadata\x18\x01 \x01(\x0b\x32\t.Metadata\x12\x0e\n\x06prompt\x18\x02 \x01(\t\x12#\n\rchat_messages\x18\x03 \x03(\x0b\x32\x0c.ChatMessage\x12,\n\x11\x65xperiment_config\x18\x04 \x01(\x0b\x32\x11.ExperimentConfig\"w\n\x10\x45xperimentConfig\x12\x30\n\x18\x66orce_enable_experiments\x18\x01 \x03(\x0e\x32\x0e.ExperimentKey\x12\x31\n\x19\x66orce_disable_experiments\x18\x02 \x03(\x0e\x32\x0e.ExperimentKey\"\xa2\x01\n\x1dRecordChatPanelSessionRequest\x12\x1b\n\x08metadata\x18\x01 \x01(\x0b\x32\t.Metadata\x12\x32\n\x0estartTimestamp\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x30\n\x0c\x65ndTimestamp\x18\x03 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\" \n\x1eRecordChatPanelSessionResponse\"<\n\x16GetChatMessageResponse\x12\"\n\x0c\x63hat_message\x18\x01 \x01(\x0b\x32\x0c.ChatMessage\",\n\x10\x44ocumentPosition\x12\x0b\n\x03row\x18\x01 \x01(\x04\x12\x0b\n\x03\x63ol\x18\x02 \x01(\x04\"\xdf\x01\n\x08\x44ocument\x12\x15\n\rabsolute_path\x18\x01 \x01(\t\x12\x15\n\rrelative_path\x18\x02 \x01(\t\x12\x0c\n\x04text\x18\x03 \x01(\t\x12\x17\n\x0f\x65\x64itor_language\x18\x04 \x01(\t\x12\x10\n\x08language\x18\x05 \x01(\x05\x12\x15\n\rcursor_offset\x18\x06 \x01(\x04\x12\x13\n\x0bline_ending\x18\x07 \x01(\t\x12*\n\x0f\x63ursor_position\x18\x08 \x01(\x0b\x32\x11.DocumentPosition\x12\x14\n\x0c\x61\x62solute_uri\x18\x0c \x01(\t\"8\n\rEditorOptions\x12\x10\n\x08tab_size\x18\x01 \x01(\x04\x12\x15\n\rinsert_spaces\x18\x02 \x01(\x08\"\x9d\x01\n\x15GetCompletionsRequest\x12\x1b\n\x08metadata\x18\x01 \x01(\x0b\x32\t.Metadata\x12\x1b\n\x08\x64ocument\x18\x02 \x01(\x0b\x32\t.Document\x12&\n\x0e\x65\x64itor_options\x18\x03 \x01(\x0b\x32\x0e.EditorOptions\x12\"\n\x0fother_documents\x18\x05 \x03(\x0b\x32\t.Document\"^\n\nCompletion\x12\x15\n\rcompletion_id\x18\x01 \x01(\t\x12\x0c\n\x04text\x18\x02 \x01(\t\x12\x0e\n\x06prefix\x18\x03 \x01(\t\x12\x0c\n\x04stop\x18\x04 \x01(\t\x12\r\n\x05score\x18\x05 \x01(\x01\"\x85\x01\n\x05Range\x12\x14\n\x0cstart_offset\x18\x01 \x01(\x04\x12\x12\n\nend_offset\x18\x02 \x01(\x04\x12)\n\x0estart_position\x18\x03 \x01(\x0b\x32\x11.DocumentPosition\x12\'\n\x0c\x65nd_position\x18\x04 \x01(\x0b\x32\x11.DocumentPosition\"3\n\x06Suffix\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x1b\n\x13\x64\x65lta_cursor_offset\x18\x02 \x01(\x03\"o\n\x0e\x43ompletionPart\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x0e\n\x06offset\x18\x02 \x01(\x04\x12!\n\x04type\x18\x03 \x01(\x0e\x32\x13.CompletionPartType\x12\x0e\n\x06prefix\x18\x04 \x01(\t\x12\x0c\n\x04line\x18\x05 \x01(\x04\"\x8c\x01\n\x0e\x43ompletionItem\x12\x1f\n\ncompletion\x18\x01 \x01(\x0b\x32\x0b.Completion\x12\x15\n\x05range\x18\x02 \x01(\x0b\x32\x06.Range\x12\x17\n\x06suffix\x18\x05 \x01(\x0b\x32\x07.Suffix\x12)\n\x10\x63ompletion_parts\x18\x08 \x03(\x0b\x32\x0f.CompletionPart\"C\n\x16GetCompletionsResponse\x12)\n\x10\x63ompletion_items\x18\x02 \x03(\x0b\x32\x0f.CompletionItem*G\n\x11\x43hatMessageSource\x12\x0f\n\x0bUNSPECIFIED\x10\x00\x12\x08\n\x04USER\x10\x01\x12\n\n\x06SYSTEM\x10\x02\x12\x0b\n\x07UNKNOWN\x10\x03*W\n\rExperimentKey\x12\x1a\n\x16\x45XPERIMENT_KEY_UNKNOWN\x10\x00\x12\x14\n\x10\x45XPERIMENT_KEY_1\x10\x01\x12\x14\n\x10\x45XPERIMENT_KEY_2\x10\x02*\xa1\x01\n\x12\x43ompletionPartType\x12$\n COMPLETION_PART_TYPE_UNSPECIFIED\x10\x00\x12\x1f\n\x1b\x43OMPLETION_PART_TYPE_INLINE\x10\x01\x12\x1e\n\x1a\x43OMPLETION_PART_TYPE_BLOCK\x10\x02\x12$\n COMPLETION_PART_TYPE_INLINE_MASK\x10\x03\x32\xfe\x01\n\x15LanguageServerService\x12\x43\n\x0eGetCompletions\x12\x16.GetCompletionsRequest\x1a\x17.GetCompletionsResponse\"\x00\x12\x43\n\x0eGetChatMessage\x12\x16.GetChatMessageRequest\x1a\x17.GetChatMessageResponse\"\x00\x12[\n\x16RecordChatPanelSession\x12\x1e.RecordChatPanelSessionRequest\x1a\x1f.RecordChatPanelSessionResponse\"\x00\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'proto_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_CHATMESSAGESOURCE']._serialized_start=1766
-  _globals['_CHATMESSAGESOURCE']._serialized_end=1837
-  _globals['_EXPERIMENTKEY']._serialized_start=1839
-  _globals['_EXPERIMENTKEY']._serialized_end=1926
+  _globals['_CHATMESSAGESOURCE']._serialized_start=2866
+  _globals['_CHATMESSAGESOURCE']._serialized_end=2937
+  _globals['_EXPERIMENTKEY']._serialized_start=2939
+  _globals['_EXPERIMENTKEY']._serialized_end=3026
+  _globals['_COMPLETIONPARTTYPE']._serialized_start=3029
+  _globals['_COMPLETIONPARTTYPE']._serialized_end=3190
   _globals['_METADATA']._serialized_start=49
   _globals['_METADATA']._serialized_end=336
   _globals['_CHATMESSAGE']._serialized_start=339
@@ -70,6 +72,26 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_RECORDCHATPANELSESSIONRESPONSE']._serialized_end=1702
   _globals['_GETCHATMESSAGERESPONSE']._serialized_start=1704
   _globals['_GETCHATMESSAGERESPONSE']._serialized_end=1764
-  _globals['_LANGUAGESERVERSERVICE']._serialized_start=1929
-  _globals['_LANGUAGESERVERSERVICE']._serialized_end=2114
+  _globals['_DOCUMENTPOSITION']._serialized_start=1766
+  _globals['_DOCUMENTPOSITION']._serialized_end=1810
+  _globals['_DOCUMENT']._serialized_start=1813
+  _globals['_DOCUMENT']._serialized_end=2036
+  _globals['_EDITOROPTIONS']._serialized_start=2038
+  _globals['_EDITOROPTIONS']._serialized_end=2094
+  _globals['_GETCOMPLETIONSREQUEST']._serialized_start=2097
+  _globals['_GETCOMPLETIONSREQUEST']._serialized_end=2254
+  _globals['_COMPLETION']._serialized_start=2256
+  _globals['_COMPLETION']._serialized_end=2350
+  _globals['_RANGE']._serialized_start=2353
+  _globals['_RANGE']._serialized_end=2486
+  _globals['_SUFFIX']._serialized_start=2488
+  _globals['_SUFFIX']._serialized_end=2539
+  _globals['_COMPLETIONPART']._serialized_start=2541
+  _globals['_COMPLETIONPART']._serialized_end=2652
+  _globals['_COMPLETIONITEM']._serialized_start=2655
+  _globals['_COMPLETIONITEM']._serialized_end=2795
+  _globals['_GETCOMPLETIONSRESPONSE']._serialized_start=2797
+  _globals['_GETCOMPLETIONSRESPONSE']._serialized_end=2864
+  _globals['_LANGUAGESERVERSERVICE']._serialized_start=3193
+  _globals['_LANGUAGESERVERSERVICE']._serialized_end=3447
 # @@protoc_insertion_point(module_scope)
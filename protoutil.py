@@ -0,0 +1,22 @@
+def dict_to_message(data, message):
+    '''
+    Fill protobuf message from dict with the same field names (as used for JSON requests).
+    Much faster than json_format.ParseDict, which checks every string with a regex:
+    about 430 ms for 10 MB document. None values are skipped, like JSON nulls.
+    Raises AttributeError for unknown field, TypeError/ValueError for wrong value type.
+    '''
+    for key, value in data.items():
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            dict_to_message(value, getattr(message, key))
+        elif isinstance(value, list):
+            field = getattr(message, key)
+            for item in value:
+                if isinstance(item, dict):
+                    dict_to_message(item, field.add())
+                else:
+                    field.append(item)
+        else:
+            setattr(message, key, value)
+    return message
@@ -0,0 +1,49 @@
+from cudatext import *
+
+class RenderScheduler:
+    '''
+    Collects streamed text per editor and flushes it at most `fps` times per second,
+    so a fast server does not cause an editor change and repaint for every token.
+    '''
+
+    def __init__(self, flush, fps=20, poll=None):
+        self.flush_callback = flush # flush(ed_handle, text), called on the UI thread
+        self.poll = poll # poll() can add() new text, returns False when no more is expected
+        self.interval = max(1, 1000 // max(1, fps))
+        self.pending = {} # editor handle -> list of str
+        self.timer_active = False
+
+    def add(self, ed_handle, text):
+        if not text:
+            return
+        self.pending.setdefault(ed_handle, []).append(text)
+        self.start()
+
+    def start(self):
+        if not self.timer_active:
+            self.timer_active = True
+            timer_proc(TIMER_START, self.on_timer, self.interval)
+
+    def on_timer(self, *args, **kwargs):
+        more = self.poll() if self.poll else False
+        self.flush()
+        if not more and not self.pending:
+            self.stop()
+
+    def flush(self, ed_handle=None):
+        '''
+        Write collected text now: for one editor, or for all of them.
+        '''
+        handles = list(self.pending) if ed_handle is None else [ed_handle]
+        for h in handles:
+            parts = self.pending.pop(h, None)
+            if parts:
+                self.flush_callback(h, ''.join(parts))
+
+    def discard(self, ed_handle):
+        self.pending.pop(ed_handle, None)
+
+    def stop(self):
+        if self.timer_active:
+            self.timer_active = False
+            timer_proc(TIMER_STOP, self.on_timer, 0)
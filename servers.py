@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import shutil
+
+MANIFEST_FILE = 'manifest.json'
+LEGACY = 'legacy' # binary of unknown version, from old plugin versions
+
+def valid(version):
+    # version is used as folder name
+    return bool(version) and os.path.basename(version) == version and version not in ('.', '..')
+
+class ServerStore:
+    '''
+    Downloaded language server binaries, one folder per version:
+    <root>/<version>/language_server_<suffix>, with manifest.json in <root>
+    which remembers when each version was installed and last used.
+    Least recently used versions above `keep` are deleted.
+    '''
+
+    def __init__(self, root, suffix, keep=2):
+        self.root = root
+        self.name = 'language_server_' + suffix
+        self.keep = max(1, keep)
+        self.manifest = self.load()
+
+    def load(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = os.path.join(self.root, MANIFEST_FILE + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, os.path.join(self.root, MANIFEST_FILE))
+
+    def path(self, version):
+        return os.path.join(self.root, version, self.name)
+
+    def installed(self, version):
+        return valid(version) and os.path.isfile(self.path(version))
+
+    def versions(self):
+        '''
+        Installed versions, most recently used first.
+        '''
+        items = [(v, info) for v, info in self.manifest.items() if valid(v) and self.installed(v)]
+        items.sort(key=lambda i: i[1].get('used', 0), reverse=True)
+        return [v for v, info in items]
+
+    def migrate(self):
+        '''
+        Binary of old plugin versions lies right in <root>. Its version is unknown:
+        users changed "version" in config and had to delete the binary by hand,
+        so it is kept as LEGACY, which never matches a configured version.
+        It can still be used while the configured version is downloaded.
+        '''
+        old = os.path.join(self.root, self.name)
+        if os.path.isfile(old) and not self.installed(LEGACY):
+            os.makedirs(os.path.dirname(self.path(LEGACY)), exist_ok=True)
+            os.replace(old, self.path(LEGACY))
+            info = self.manifest.setdefault(LEGACY, {})
+            # least recently used, so any downloaded version is preferred
+            info['installed'] = info['used'] = 0
+            self.save()
+
+    def add(self, version):
+        info = self.manifest.setdefault(version, {})
+        info['installed'] = info['used'] = time.time()
+        self.save()
+
+    def use(self, version):
+        info = self.manifest.setdefault(version, {'installed': time.time()})
+        info['used'] = time.time()
+        self.save()
+
+    def cleanup(self, protect=()):
+        '''
+        Delete least recently used versions, except `protect` ones, so `keep` are left.
+        '''
+        removed = []
+        for version in self.versions()[self.keep:]:
+            if version in protect:
+                continue
+            shutil.rmtree(os.path.join(self.root, version), ignore_errors=True)
+            self.manifest.pop(version, None)
+            removed.append(version)
+        if removed:
+            self.save()
+        return removed
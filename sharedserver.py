@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import signal
+import threading
+import subprocess
+
+IS_WIN = os.name=='nt'
+
+def pid_alive(pid):
+    if IS_WIN:
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass # exists, but belongs to other user
+    return True
+
+class FileLock:
+    '''
+    Exclusive lock of a file, between processes. Blocks until the lock is taken.
+    Also between threads of our process: it is used from the UI thread and from workers.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+        self.thread_lock = threading.Lock()
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.f = open(self.path, 'a+b')
+            if IS_WIN:
+                import msvcrt
+                self.f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass # LK_LOCK gives up after 10 s
+            else:
+                import fcntl
+                fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        except:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+            self.thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *args):
+        if IS_WIN:
+            import msvcrt
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+        # on POSIX closing the file releases the lock
+        try:
+            self.f.close()
+        finally:
+            self.f = None
+            self.thread_lock.release()
+
+class AttachedProcess:
+    '''
+    Language server started by another CudaText instance.
+    Has the part of subprocess.Popen interface which is used for our own server.
+    '''
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None and not pid_alive(self.pid):
+            self.returncode = -1 # real exit code is known only to the parent
+        return self.returncode
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() > deadline:
+                raise subprocess.TimeoutExpired('language_server', timeout)
+            time.sleep(0.05)
+        return self.returncode
+
+    def terminate(self):
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+    def kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL if not IS_WIN else signal.SIGTERM)
+        except OSError:
+            pass
+
+class SharedServer:
+    '''
+    Discovery file of the language server which is shared by all CudaText
+    instances of the user: <data>/server.json with the server pid, port,
+    version, manager_dir and pids of the instances which use it (clients).
+    Every change is done under server.lock, so instances starting at the
+    same time can't both register a server. Clients which have died without
+    leaving are dropped when the file is changed.
+    The last client which leaves must stop the server.
+    '''
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, 'server.json')
+        self.lock = FileLock(os.path.join(folder, 'server.lock'))
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                record = json.load(f)
+            if not pid_alive(record['pid']):
+                return None
+            record['clients'] = [pid for pid in record.get('clients', []) if pid_alive(pid)]
+            return record
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _save(self, record):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def read(self):
+        '''
+        Returns the record of the running shared server, or None.
+        '''
+        with self.lock:
+            return self._load()
+
+    def join(self, client, server_pid):
+        '''
+        Registers client; False if that server is not registered anymore.
+        '''
+        with self.lock:
+            record = self._load()
+            if record is None or record['pid'] != server_pid:
+                return False
+            if client not in record['clients']:
+                record['clients'].append(client)
+            self._save(record)
+            return True
+
+    def publish(self, client, pid, port, version, executable, manager_dir):
+        '''
+        Registers just started server. False if another live server is
+        registered already (started by other instance at the same time).
+        '''
+        with self.lock:
+            record = self._load()
+            if record is not None and record['pid'] != pid:
+                return False
+            self._save({
+                'pid': pid,
+                'port': port,
+                'version': version,
+                'executable': executable,
+                'manager_dir': manager_dir,
+                'clients': [client],
+                'started': time.time(),
+            })
+            return True
+
+    def leave(self, client, server_pid):
+        '''
+        Unregisters client. Returns True if nobody uses that server anymore, so it must be stopped.
+        '''
+        with self.lock:
+            record = self._load()
+            if record is None or record['pid'] != server_pid:
+                return True
+            record['clients'] = [pid for pid in record['clients'] if pid != client]
+            if record['clients']:
+                self._save(record)
+                return False
+            self._remove()
+            return True
@@ -0,0 +1,90 @@
+import json
+import time
+from collections import deque
+
+class ChatProbe:
+    '''
+    Timings of one chat answer, in seconds from the moment the question was asked.
+    Network fields are filled by the worker, render fields on the UI thread.
+    '''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.build = None # request is built
+        self.sent = None # worker started the request (could wait in the queue)
+        self.first_byte = None # first chunk received
+        self.first_token = None # first text rendered in the tab
+        self.end = None # stream finished
+        self.frames = 0
+        self.bytes = 0
+        self.chars = 0
+        self.decode = 0.0 # total time of frame splitting and decoding
+        self.render = 0.0 # total time of writing to the tab
+        self.cancelled = False
+        self.error = None
+
+    def now(self):
+        return time.perf_counter() - self.start
+
+    def as_dict(self):
+        d = dict(self.__dict__)
+        del d['start']
+        d['time'] = time.time()
+        stream_time = (self.end or 0) - (self.first_byte or 0)
+        if stream_time > 0:
+            d['frames_per_sec'] = self.frames / stream_time
+            d['bytes_per_sec'] = self.bytes / stream_time
+        return d
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return None
+    def p(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+    return p(0.5), p(0.9), values[-1]
+
+class Stats:
+    '''
+    Ring buffer of last ChatProbe results, optionally appended to JSON-lines file.
+    '''
+
+    FIELDS = (
+        ('build', 'request build, ms', 1000),
+        ('first_byte', 'time to first byte, ms', 1000),
+        ('first_token', 'time to first token, ms', 1000),
+        ('end', 'total time, ms', 1000),
+        ('decode', 'decode time, ms', 1000),
+        ('render', 'render time, ms', 1000),
+        ('frames_per_sec', 'frames/s', 1),
+        ('bytes_per_sec', 'KB/s', 1/1024),
+    )
+
+    def __init__(self, size=100, log_file=''):
+        self.items = deque(maxlen=size)
+        self.log_file = log_file
+
+    def add(self, probe):
+        item = probe.as_dict()
+        self.items.append(item)
+        if self.log_file:
+            try:
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(item) + '\n')
+            except OSError as e:
+                print("ERROR: cannot write stats log:", e)
+
+    def summary(self):
+        lines = ['Chat answers: {} (canceled: {}, errors: {})'.format(
+            len(self.items),
+            sum(1 for i in self.items if i['cancelled']),
+            sum(1 for i in self.items if i['error']),
+        )]
+        if not self.items:
+            return lines[0]
+        lines.append('{:<24}{:>10}{:>10}{:>10}'.format('', 'median', 'p90', 'max'))
+        for key, caption, scale in self.FIELDS:
+            result = _percentiles([i[key] * scale for i in self.items if i.get(key) is not None])
+            if result:
+                lines.append('{:<24}{:>10.1f}{:>10.1f}{:>10.1f}'.format(caption, *result))
+        return '\n'.join(lines)
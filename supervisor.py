@@ -0,0 +1,79 @@
+import time
+
+class Supervisor:
+    '''
+    Health of the language server process.
+    Server is considered dead when its process has exited, or when
+    `max_failures` heartbeats in a row have failed (process hangs).
+    Restarts are delayed with exponential backoff; after the server has been
+    healthy for `stable_time` the backoff starts from the beginning again.
+    After `max_restarts` failed attempts in a row it gives up.
+    Doesn't use cudatext API; all methods are called on the UI thread.
+    '''
+
+    def __init__(self, max_failures=3, backoff_min=1.0, backoff_max=60.0, stable_time=60.0, max_restarts=5):
+        self.max_failures = max_failures
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.stable_time = stable_time
+        self.max_restarts = max_restarts
+
+        self.process = None
+        self.started = None # time.monotonic() of the last start
+        self.failures = 0 # heartbeats failed in a row
+        self.attempt = 0 # restarts since the server was last stable
+        self.restarts = 0 # total during the session
+        self.last_reason = None
+
+    def watch(self, process):
+        self.process = process
+        self.started = time.monotonic()
+        self.failures = 0
+
+    def stop(self):
+        self.process = None
+        self.started = None
+        self.failures = 0
+        self.attempt = 0
+
+    @property
+    def restarting(self):
+        return self.attempt > 0
+
+    def exit_code(self):
+        '''
+        Returns exit code if the watched process has exited, else None.
+        '''
+        if self.process is None:
+            return None
+        return self.process.poll()
+
+    def uptime(self):
+        if self.started is None:
+            return None
+        return time.monotonic() - self.started
+
+    def heartbeat_ok(self):
+        self.failures = 0
+        if self.attempt and self.uptime() >= self.stable_time:
+            self.attempt = 0
+
+    def heartbeat_failed(self):
+        '''
+        Returns True if the server must be restarted.
+        '''
+        self.failures += 1
+        return self.failures >= self.max_failures
+
+    def next_delay(self, reason):
+        '''
+        Counts the restart, returns delay in seconds before it, or None to give up.
+        '''
+        self.last_reason = reason
+        if self.attempt >= self.max_restarts:
+            self.attempt = 0
+            return None
+        delay = min(self.backoff_min * 2 ** self.attempt, self.backoff_max)
+        self.attempt += 1
+        self.restarts += 1
+        return delay
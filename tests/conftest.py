@@ -0,0 +1,18 @@
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# plugin's __init__.py needs CudaText, so the package is registered without
+# running it: only standalone modules (frames, chatstream, ...) are tested.
+# pytest also imports the plugin folder as a package, by its folder name
+for name in ('cuda_codeium', os.path.basename(ROOT)):
+    if name not in sys.modules:
+        package = types.ModuleType(name)
+        package.__path__ = [ROOT]
+        sys.modules[name] = package
+
+# proto_pb2 imports bundled google.protobuf, as in the plugin
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
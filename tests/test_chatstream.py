@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+pytest.importorskip('requests') # chatstream module uses it for the HTTP part
+
+from cuda_codeium.chatstream import ChatStreamAssembler, encode_len_field
+from cuda_codeium.frames import FrameDecoder, frame
+
+CONVERSATION_ID = 'conv-1'
+
+def response(answer, conversation_id=CONVERSATION_ID):
+    '''
+    GetChatMessageResponse with the whole answer so far, as the server sends it.
+    '''
+    text = encode_len_field(1, answer)
+    action = encode_len_field(1, text)
+    message = encode_len_field(1, b'bot-1') + encode_len_field(4, conversation_id.encode()) + encode_len_field(6, action)
+    return encode_len_field(1, message)
+
+def stream_of(answer, steps):
+    '''
+    Frames with growing answer, cut at the given byte positions.
+    '''
+    return [frame(response(answer[:n])) for n in steps]
+
+def assemble(chunks, assembler=None):
+    assembler = assembler or ChatStreamAssembler()
+    decoder = FrameDecoder()
+    parts = []
+    for chunk in chunks:
+        for payload in decoder.feed(chunk):
+            text = assembler.feed(payload)
+            if text is not None:
+                parts.append(text)
+    return assembler, parts
+
+def test_deltas():
+    answer = b'Hello, world! This is the answer.'
+    assembler, parts = assemble(stream_of(answer, [5, 13, len(answer)]))
+    assert parts == ['Hello', ', world!', ' This is the answer.']
+    assert assembler.text() == answer.decode()
+    assert assembler.conversation_id == CONVERSATION_ID
+    assert assembler.frames == 3
+
+def test_multibyte_split_between_frames():
+    answer = 'Привет, 世界 🙂'.encode('utf-8')
+    # every byte position, so each character is cut in the middle somewhere
+    assembler, parts = assemble(stream_of(answer, range(1, len(answer) + 1)))
+    assert ''.join(parts) == answer.decode()
+    assert '�' not in ''.join(parts)
+    assert parts[0] == '' # first byte of 'П' alone is not a character yet
+    assert parts[1] == 'П'
+
+def test_random_chunking_of_recorded_stream():
+    rnd = random.Random(2)
+    answer = ('Ответ номер {} 🙂\n'.format(i) for i in range(300))
+    answer = ''.join(answer).encode('utf-8')
+    steps = sorted(rnd.sample(range(1, len(answer)), 150)) + [len(answer)]
+    stream = b''.join(stream_of(answer, steps))
+    chunks = []
+    pos = 0
+    while pos < len(stream):
+        size = rnd.randrange(1, 9000)
+        chunks.append(stream[pos:pos+size])
+        pos += size
+    assembler, parts = assemble(chunks)
+    assert ''.join(parts) == answer.decode()
+
+def test_reset_when_answer_is_replaced():
+    assembler, parts = assemble([frame(response(b'first version')), frame(response(b'new'))])
+    assert parts == ['first version', 'new']
+    assert assembler.reset
+    assert assembler.text() == 'new'
+
+def test_not_a_conversation_message():
+    assembler = ChatStreamAssembler()
+    assert assembler.feed(b'') is None
+    assert assembler.feed(encode_len_field(2, b'other')) is None
+    assert assembler.frames == 0
+
+def test_text_is_not_kept_for_export():
+    answer = b'written to file'
+    assembler, parts = assemble(stream_of(answer, [7, len(answer)]), ChatStreamAssembler(keep_text=False))
+    assert ''.join(parts) == answer.decode()
+    assert assembler.text() == ''
+
+def test_message_for_history():
+    proto_pb2 = pytest.importorskip('cuda_codeium.proto_pb2')
+    answer = 'answer 🙂'.encode('utf-8')
+    assembler, parts = assemble(stream_of(answer, [3, len(answer)]))
+    message = assembler.message(proto_pb2)
+    assert message.conversationId == CONVERSATION_ID
+    assert message.messageId == 'bot-1'
+    generic = proto_pb2.Generic.FromString(message.action.text)
+    assert generic.text == answer.decode()
@@ -0,0 +1,127 @@
+import os
+import gzip
+import random
+import threading
+import http.server
+
+import pytest
+
+pytest.importorskip('requests') # download module uses it for the HTTP part
+
+from cuda_codeium.download import download_gz, DownloadError, ChecksumError
+
+PAYLOAD = random.Random(0).randbytes(300 * 1024) # incompressible, several chunks of gz data
+DATA = gzip.compress(PAYLOAD)
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    '''
+    Serves `data` of the server. Modes:
+    'range' - Range is supported, 416 if nothing is left,
+    'ignore_range' - whole file with 200 always,
+    'cut' - connection is closed in the middle of the body.
+    '''
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        server.ranges.append(self.headers.get('Range'))
+        data = server.data
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and server.mode == 'range':
+            start = int(range_header.split('=')[1].rstrip('-'))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(len(data)))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if server.mode == 'cut':
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    httpd.data = DATA
+    httpd.mode = 'range'
+    httpd.ranges = [] # Range header of every request
+    httpd.url = 'http://127.0.0.1:{}/language_server.gz'.format(httpd.server_address[1])
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def test_resume_after_interrupt(server, tmp_path):
+    out_file = str(tmp_path / 'language_server')
+    part_file = out_file + '.gz.part'
+
+    server.mode = 'cut'
+    with pytest.raises(DownloadError):
+        download_gz(server.url, out_file)
+    # received part is kept for the next attempt
+    received = os.path.getsize(part_file)
+    assert 0 < received < len(DATA)
+    assert not os.path.exists(out_file)
+    assert not os.path.exists(out_file + '.tmp')
+
+    server.mode = 'range'
+    done = []
+    download_gz(server.url, out_file, progress=lambda *args: done.append(args))
+    assert server.ranges[-1] == 'bytes={}-'.format(received)
+    assert read(out_file) == PAYLOAD
+    assert done[-1] == (len(DATA), len(DATA))
+    assert not os.path.exists(part_file)
+
+def test_complete_part(server, tmp_path):
+    # everything was received, but not decompressed yet: server answers 416
+    out_file = str(tmp_path / 'language_server')
+    write(out_file + '.gz.part', DATA)
+    download_gz(server.url, out_file)
+    assert server.ranges == ['bytes={}-'.format(len(DATA))]
+    assert read(out_file) == PAYLOAD
+    assert not os.path.exists(out_file + '.gz.part')
+
+def test_range_ignored(server, tmp_path):
+    # 200 instead of 206: download starts from the beginning
+    out_file = str(tmp_path / 'language_server')
+    write(out_file + '.gz.part', DATA[:len(DATA) // 3])
+    server.mode = 'ignore_range'
+    download_gz(server.url, out_file)
+    assert server.ranges == ['bytes={}-'.format(len(DATA) // 3)]
+    assert read(out_file) == PAYLOAD
+    assert not os.path.exists(out_file + '.gz.part')
+
+def test_corrupt_archive(server, tmp_path):
+    # gzip trailer has wrong CRC
+    out_file = str(tmp_path / 'language_server')
+    crc = bytes(b ^ 0xff for b in DATA[-8:-4])
+    server.data = DATA[:-8] + crc + DATA[-4:]
+    with pytest.raises(ChecksumError):
+        download_gz(server.url, out_file)
+    # broken data can't be resumed, next attempt starts from scratch
+    assert not os.path.exists(out_file)
+    assert not os.path.exists(out_file + '.tmp')
+    assert not os.path.exists(out_file + '.gz.part')
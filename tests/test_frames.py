@@ -0,0 +1,90 @@
+import gzip
+import json
+import random
+import zlib
+
+from cuda_codeium.frames import (FrameDecoder, frame, FLAG_COMPRESSED, FLAG_END_STREAM,
+    FLAG_TRAILERS, COMPACT_SIZE)
+
+def raw_frame(flags, payload):
+    return bytes([flags]) + len(payload).to_bytes(4, 'big') + payload
+
+def decode(decoder, chunks):
+    return [bytes(payload) for chunk in chunks for payload in decoder.feed(chunk)]
+
+def test_all_frames_of_chunk():
+    payloads = [b'a', b'', b'bc' * 100, b'd']
+    decoder = FrameDecoder()
+    assert decode(decoder, [b''.join(frame(p) for p in payloads)]) == payloads
+    assert decoder.pending() == 0
+
+def test_random_chunking():
+    rnd = random.Random(1)
+    payloads = [bytes(rnd.randrange(256) for __ in range(rnd.randrange(2000))) for __ in range(200)]
+    stream = b''.join(frame(p) for p in payloads)
+    for __ in range(20):
+        chunks = []
+        pos = 0
+        while pos < len(stream):
+            size = rnd.randrange(1, 700)
+            chunks.append(stream[pos:pos+size])
+            pos += size
+        decoder = FrameDecoder()
+        assert decode(decoder, chunks) == payloads
+        assert decoder.pending() == 0
+
+def test_compaction_keeps_unread_part():
+    payloads = [b'x' * 1000 for __ in range(COMPACT_SIZE // 1000 * 3)]
+    stream = b''.join(frame(p) for p in payloads)
+    decoder = FrameDecoder()
+    # chunk ends in the middle of a frame, so the buffer always has unread bytes
+    chunks = [stream[i:i+4099] for i in range(0, len(stream), 4099)]
+    assert decode(decoder, chunks) == payloads
+    assert len(decoder.buffer) < len(stream)
+
+def test_header_split_across_chunks():
+    data = frame(b'hello') + frame(b'world')
+    decoder = FrameDecoder()
+    # header is 5 bytes, 4 bytes of it must not be taken as complete size
+    assert decode(decoder, [data[:1]]) == []
+    assert decode(decoder, [data[1:4]]) == []
+    assert decoder.pending() == 4
+    assert decode(decoder, [data[4:12]]) == [b'hello']
+    assert decode(decoder, [data[12:]]) == [b'world']
+
+def test_compressed_frame():
+    payload = b'compressed answer ' * 50
+    decoder = FrameDecoder()
+    chunks = [raw_frame(FLAG_COMPRESSED, gzip.compress(payload)),
+              raw_frame(FLAG_COMPRESSED, zlib.compress(payload)), # deflate
+              frame(b'plain')]
+    assert decode(decoder, chunks) == [payload, payload, b'plain']
+
+def test_grpc_web_trailers_with_error():
+    trailers = b'grpc-status: 13\r\ngrpc-message: internal failure\r\n'
+    decoder = FrameDecoder()
+    assert decode(decoder, [frame(b'part'), raw_frame(FLAG_TRAILERS, trailers)]) == [b'part']
+    assert decoder.trailers['grpc-status'] == '13'
+    assert decoder.error() == 'internal failure (status 13)'
+
+def test_grpc_web_trailers_ok():
+    decoder = FrameDecoder()
+    decode(decoder, [raw_frame(FLAG_TRAILERS, b'grpc-status: 0\r\n')])
+    assert decoder.error() is None
+
+def test_connect_end_stream_with_error():
+    end = json.dumps({'error': {'code': 'resource_exhausted', 'message': 'rate limit'}}).encode()
+    decoder = FrameDecoder()
+    assert decode(decoder, [frame(b'part') + raw_frame(FLAG_END_STREAM, end)]) == [b'part']
+    assert decoder.error() == 'rate limit (status resource_exhausted)'
+
+def test_connect_end_stream_ok():
+    decoder = FrameDecoder()
+    decode(decoder, [raw_frame(FLAG_END_STREAM, b'{}')])
+    assert decoder.trailers == {'grpc-status': '0'}
+    assert decoder.error() is None
+
+def test_no_trailers_yet():
+    decoder = FrameDecoder()
+    decode(decoder, [frame(b'part')])
+    assert decoder.error() is None